@@ -3,36 +3,61 @@ import re
 import sys
 from dataclasses import (
     dataclass,
-    asdict
+    asdict,
+    fields
 )
 from datetime import datetime
 from time import (
     time,
+    monotonic,
     sleep
 )
 from os import (
     stat,
     makedirs,
     remove,
+    walk,
+    sysconf,
+    cpu_count,
+    listdir,
+    rename,
+    environ,
+    getpid,
 )
 from os.path import (
     join,
     exists,
     expanduser,
-    isdir
+    isdir,
+    dirname
 )
 from shutil import (
     copytree,
     rmtree
 )
 from uuid import uuid1
+from random import Random
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from threading import (
+    Thread,
+    Lock,
+    Event
+)
+from queue import (
+    Queue,
+    Empty
+)
 import json
+import math
 import subprocess
 import statistics
 
 from itertools import (
     cycle,
-    islice
+    islice,
+    combinations
 )
 
 import argparse
@@ -240,6 +265,72 @@ def retriable(function, *args, timeout=0.2, retries=10):
         sleep(timeout)
 
 
+#######
+#
+#   SCHEDULE
+#
+######
+
+
+@dataclass
+class Tick:
+    index: int
+    missed: int
+
+
+def fixed_rate_ticks(period):
+    # "probe; sleep(period)" drifts, real period is period + probe
+    # cost. Target absolute monotonic deadlines start + index * period
+    # instead. If probe took longer than period, skip to the latest
+    # passed deadline, report skipped deadlines as missed
+    start = monotonic()
+    index, missed = 0, 0
+    while True:
+        yield Tick(index, missed)
+
+        now = monotonic()
+        passed = int((now - start) / period)
+        if passed > index:
+            missed = passed - index - 1
+            index = passed
+        else:
+            missed = 0
+            index += 1
+            sleep(start + index * period - now)
+
+
+ARRIVALS = ['constant', 'poisson']
+
+
+def arrival_offsets(rate, size, process='constant', seed=1):
+    # Seconds from feed start, rate is records per second. Poisson
+    # process has exponential inter-arrival times
+    if process == 'constant':
+        return [index / rate for index in range(size)]
+
+    random = Random(seed)
+    offsets, offset = [], 0
+    for _ in range(size):
+        offsets.append(offset)
+        offset += random.expovariate(rate)
+    return offsets
+
+
+def pace_lines(lines, offsets, scheduled):
+    # Open loop, yield every line at its arrival time regardless of
+    # model progress. Keep scheduled time, not actual write time, so
+    # time blocked on full pipe counts as latency, no coordinated
+    # omission
+    start = monotonic()
+    for line, offset in zip(lines, offsets):
+        stamp = start + offset
+        delay = stamp - monotonic()
+        if delay > 0:
+            sleep(delay)
+        scheduled.append(round(stamp, 4))
+        yield line
+
+
 ######
 #
 #   PS
@@ -253,29 +344,380 @@ class PsStatsRecord:
     cpu_usage: float
     ram: int
 
+    # VmHWM, peak RSS over process lifetime, /proc only
+    peak_ram: int = None
 
-def ps_stats(pid):
-    command = [
-        'ps', '--no-headers', '-q', str(pid),
-        '-o', '%cpu,rss'
-    ]
-    output = subprocess.run(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        encoding='utf8'
-    ).stdout
 
-    # 0.2  18988
-    parts = output.split()
-    if not parts:
+######
+#
+#   PROC
+#
+####
+
+
+CLOCK_TICKS = sysconf('SC_CLK_TCK')
+PAGE_SIZE = sysconf('SC_PAGE_SIZE')
+
+
+@dataclass
+class ProcStatRecord:
+    pid: int
+    ppid: int
+    utime: int
+    stime: int
+    starttime: int
+    majflt: int = None
+
+
+@dataclass
+class ProcStatmRecord:
+    size: int
+    resident: int
+
+
+def proc_path(pid, name):
+    return f'/proc/{pid}/{name}'
+
+
+def load_proc_text(pid, name):
+    try:
+        return load_text(proc_path(pid, name))
+    except (FileNotFoundError, ProcessLookupError):
+        # process exited between probes
+        return
+
+
+def parse_proc_stat(text):
+    # 2871 (python3 main.py) R 2867 2871 2867 0 -1 4194304 84 0 0 0 0 0 ...
+    # comm may contain spaces and parens, split after the last paren
+    pid, rest = text.split(' ', 1)
+    rest = rest[rest.rindex(')') + 2:]
+    parts = rest.split()
+
+    # man 5 proc, fields from 3: state ppid ... majflt(12) ...
+    # utime(14) stime(15) ... starttime(22)
+    return ProcStatRecord(
+        pid=int(pid),
+        ppid=int(parts[1]),
+        utime=int(parts[11]),
+        stime=int(parts[12]),
+        starttime=int(parts[19]),
+        majflt=int(parts[9]),
+    )
+
+
+def parse_proc_statm(text):
+    # 660 326 301 5 0 123 0, in pages
+    size, resident, *_ = text.split()
+    return ProcStatmRecord(
+        size=int(size) * PAGE_SIZE,
+        resident=int(resident) * PAGE_SIZE
+    )
+
+
+def parse_proc_status(text):
+    # Name:\tpython3
+    # VmHWM:\t    1316 kB
+    for line in text.splitlines():
+        key, value = line.split(':', 1)
+        value = value.strip()
+        if value.endswith(' kB'):
+            value = int(value[:-3]) * KB
+        yield key, value
+
+
+def proc_stat(pid):
+    text = load_proc_text(pid, 'stat')
+    if text:
+        return parse_proc_stat(text)
+
+
+def proc_statm(pid):
+    text = load_proc_text(pid, 'statm')
+    if text:
+        return parse_proc_statm(text)
+
+
+def proc_status(pid):
+    text = load_proc_text(pid, 'status')
+    if text:
+        return dict(parse_proc_status(text))
+
+
+@dataclass
+class ProcIoRecord:
+    read_bytes: int
+    write_bytes: int
+
+
+def parse_proc_io(text):
+    # rchar: 323934931
+    # wchar: 323929600
+    # ...
+    # read_bytes: 323932160
+    # write_bytes: 323932160
+    for line in text.splitlines():
+        key, value = line.split(':', 1)
+        yield key, int(value)
+
+
+def proc_io(pid):
+    # Storage I/O, page cache hits are not counted in read_bytes.
+    # Needs ptrace access, other user processes give EACCES
+    try:
+        text = load_proc_text(pid, 'io')
+    except PermissionError:
+        return
+    if text:
+        io = dict(parse_proc_io(text))
+        return ProcIoRecord(io['read_bytes'], io['write_bytes'])
+
+
+def proc_uptime():
+    # 592.15 560.53
+    text = load_text('/proc/uptime')
+    uptime, _ = text.split()
+    return float(uptime)
+
+
+def proc_ps_stats(pid, stat=None):
+    # Same as ps -o %cpu,rss without forking ps. Reads
+    # /proc/<pid>/{stat,statm,status} directly, works for any local
+    # pid. Pass stat if already read this tick
+    stat = stat or proc_stat(pid)
+    statm = proc_statm(pid)
+    status = proc_status(pid)
+    if not stat or not statm or not status:
+        return
+
+    # ps %cpu = cpu time / process lifetime
+    cpu_time = (stat.utime + stat.stime) / CLOCK_TICKS
+    lifetime = proc_uptime() - stat.starttime / CLOCK_TICKS
+    cpu_usage = 0
+    if lifetime > 0:
+        cpu_usage = round(cpu_time / lifetime, 4)
+
+    # zombies have no VmRSS in status, fallback to statm
+    ram = status.get('VmRSS', statm.resident)
+    return PsStatsRecord(pid, cpu_usage, ram, status.get('VmHWM'))
+
+
+#####
+#
+#   CPU
+#
+####
+
+
+CPU_COUNT = cpu_count()
+
+
+@dataclass
+class CpuTimeRecord:
+    timestamp: float
+    cpu_time: float
+
+
+@dataclass
+class CpuUsageRecord:
+    cores: float
+    load: float
+
+
+def stat_cpu_time(stat):
+    cpu_time = (stat.utime + stat.stime) / CLOCK_TICKS
+    return CpuTimeRecord(monotonic(), cpu_time)
+
+
+def cpu_usage_delta(previous, current, cpu_count=CPU_COUNT):
+    # ps %cpu is cpu time / process lifetime, smears spikes. Use
+    # jiffies delta between two consecutive probes instead
+    duration = current.timestamp - previous.timestamp
+    if duration <= 0:
+        return
+
+    # 2 cores busy for 1 sec -> cores=2, load=2 / 8 = 0.25
+    cores = (current.cpu_time - previous.cpu_time) / duration
+    cores = max(cores, 0)
+    return CpuUsageRecord(
+        cores=round(cores, 4),
+        load=round(cores / cpu_count, 4)
+    )
+
+
+######
+#
+#   TREE
+#
+#####
+
+
+def proc_pids():
+    for name in listdir('/proc'):
+        if name.isdigit():
+            yield int(name)
+
+
+def proc_all_stats():
+    for pid in proc_pids():
+        stat = proc_stat(pid)
+        if stat:
+            yield stat
+
+
+# CONFIG_PROC_CHILDREN, on in mainstream distro kernels
+PROC_CHILDREN = exists(f'/proc/self/task/{getpid()}/children')
+
+
+def proc_children(pid):
+    # 2872 2873, one file per thread, fork from any thread lands there
+    children = []
+    try:
+        tids = listdir(proc_path(pid, 'task'))
+    except FileNotFoundError:
+        return children
+
+    for tid in tids:
+        text = load_proc_text(pid, f'task/{tid}/children')
+        if text:
+            children.extend(int(_) for _ in text.split())
+    return children
+
+
+def proc_scan_tree_stats(pid):
+    # Without children files. Reads stat of every process on host,
+    # ~20ms with 1000 processes
+    stats = list(proc_all_stats())
+    children = defaultdict(list)
+    for record in stats:
+        children[record.ppid].append(record)
+
+    queue = [_ for _ in stats if _.pid == pid]
+    while queue:
+        record = queue.pop()
+        yield record
+        queue.extend(children[record.pid])
+
+
+def proc_tree_stats(pid, stat=None):
+    # docker inspect gives container root pid, usually a shell or
+    # python. Tokenizer workers, DataLoader subprocesses are children.
+    # Walk down from root, cost is tree size, not host process count
+    if not PROC_CHILDREN:
+        yield from proc_scan_tree_stats(pid)
+        return
+
+    stat = stat or proc_stat(pid)
+    queue = [stat] if stat else []
+    while queue:
+        record = queue.pop()
+        yield record
+        for child in proc_children(record.pid):
+            # exited between reads
+            record = proc_stat(child)
+            if record:
+                queue.append(record)
+
+
+@dataclass
+class TreeStatsRecord:
+    size: int
+    cpu_times: dict
+    ram: int
+
+
+def proc_tree_ps_stats(pid, stat=None):
+    cpu_times = {}
+    ram = 0
+    for record in proc_tree_stats(pid, stat):
+        statm = proc_statm(record.pid)
+        if not statm:
+            continue
+
+        cpu_times[record.pid] = (record.utime + record.stime) / CLOCK_TICKS
+        # shared pages are counted for every process, same as
+        # summing ps rss
+        ram += statm.resident
+
+    if cpu_times:
+        return TreeStatsRecord(len(cpu_times), cpu_times, ram)
+
+
+def tree_cpu_time_delta(previous, current):
+    # Processes come and go. Sum per pid deltas, count all cpu time
+    # of processes started after previous probe. Time of children
+    # exited between probes is lost
+    return sum(
+        cpu_time - previous.get(pid, 0)
+        for pid, cpu_time in current.items()
+    )
+
+
+######
+#
+#   CGROUP
+#
+#####
+
+
+CGROUP_ROOTS = [
+    '/sys/fs/cgroup',
+    # hybrid v1/v2 layout
+    '/sys/fs/cgroup/unified',
+]
+
+
+@dataclass
+class CgroupStatsRecord:
+    cpu_time: float
+    ram: int
+    peak_ram: int
+
+
+def proc_cgroup_dir(pid, roots=CGROUP_ROOTS):
+    # 0::/system.slice/docker-2c41a5f....scope
+    text = load_proc_text(pid, 'cgroup')
+    if not text:
+        return
+
+    for line in text.splitlines():
+        id, _, path = line.split(':', 2)
+        if id == '0':
+            for root in roots:
+                dir = root + path
+                if exists(join(dir, 'memory.current')):
+                    return dir
+
+
+def load_cgroup_int(dir, name):
+    path = join(dir, name)
+    if exists(path):
+        return int(load_text(path))
+
+
+def parse_cgroup_cpu_stat(text):
+    # usage_usec 15277347
+    # user_usec 10493591
+    # ...
+    for line in text.splitlines():
+        key, value = line.split()
+        yield key, int(value)
+
+
+def cgroup_stats(dir):
+    # cgroup v2 only. Container cgroup is removed on exit
+    try:
+        text = load_text(join(dir, 'cpu.stat'))
+        ram = load_cgroup_int(dir, 'memory.current')
+
+        # memory.peak since linux 5.19
+        peak_ram = load_cgroup_int(dir, 'memory.peak')
+    except FileNotFoundError:
         return
 
-    cpu_usage, ram = parts
-    # 90.1 / 100 -> 0.900999999
-    cpu_usage = round(float(cpu_usage) / 100, 4)
-    ram = int(ram) * KB
-    return PsStatsRecord(pid, cpu_usage, ram)
+    cpu_stat = dict(parse_cgroup_cpu_stat(text))
+    cpu_time = cpu_stat['usage_usec'] / 1000000
+    return CgroupStatsRecord(cpu_time, ram, peak_ram)
 
 
 #######
@@ -291,6 +733,7 @@ class NvidiaGPUStatsRecord:
     total_gpu_ram: int
     gpu_usage: float
     gpu_ram_usage: int
+    power: float = None
 
 
 @dataclass
@@ -311,8 +754,14 @@ MIBS = {
 }
 
 
+# MIG devices, some boards
+NVIDIA_MISSING = {'[N/A]', '[Not Supported]'}
+
+
 def parse_nvidia_gpu_ram(value):
     # 4443 MiB
+    if value in NVIDIA_MISSING:
+        return
     value, mib = value[:-3], value[-3:]
     value = value.strip()
     return int(float(value) * MIBS[mib])
@@ -320,17 +769,30 @@ def parse_nvidia_gpu_ram(value):
 
 def parse_nvidia_usage(value):
     # 22 %
+    if value in NVIDIA_MISSING:
+        return
     return float(value[:-2]) / 100
 
 
+def parse_nvidia_power(value):
+    # 71.34 W
+    if value in NVIDIA_MISSING:
+        return
+    return float(value[:-2])
+
+
 def parse_nvidia_gpu_stats(record):
-    # memory.total [MiB], utilization.gpu [%], utilization.memory [%]
-    # GPU-777aa4a9-8dac-a61b-5b5a-118d3e947546, 32510 MiB, 43 %, 22 %
-    guid, total_gpu_ram, gpu_usage, gpu_ram_usage = record
+    # memory.total [MiB], utilization.gpu [%], utilization.memory [%], power.draw [W]
+    # GPU-777aa4a9-8dac-a61b-5b5a-118d3e947546, 32510 MiB, 43 %, 22 %, 71.34 W
+    guid, total_gpu_ram, gpu_usage, gpu_ram_usage, power = record
     total_gpu_ram = parse_nvidia_gpu_ram(total_gpu_ram)
     gpu_usage = parse_nvidia_usage(gpu_usage)
     gpu_ram_usage = parse_nvidia_usage(gpu_ram_usage)
-    return NvidiaGPUStatsRecord(guid, total_gpu_ram, gpu_usage, gpu_ram_usage)
+    power = parse_nvidia_power(power)
+    return NvidiaGPUStatsRecord(
+        guid, total_gpu_ram, gpu_usage, gpu_ram_usage,
+        power=power
+    )
 
 
 def parse_nvidia_process_stats(record):
@@ -342,37 +804,116 @@ def parse_nvidia_process_stats(record):
     return NvidiaProcessStatsRecord(pid, guid, gpu_ram)
 
 
-def parse_nvidia_output(output):
-    lines = output.splitlines()
-    records = parse_tsv(lines, sep=', ')
-    next(records)
-    return records
+NVIDIA_GPU_QUERY = (
+    '--query-gpu=gpu_uuid,memory.total,utilization.gpu,utilization.memory,power.draw'
+)
+NVIDIA_PROCESS_QUERY = '--query-compute-apps=pid,gpu_uuid,used_memory'
 
 
-def nvidia_gpu_stats(guid):
-    command = [
-        'nvidia-smi', '--format=csv',
-        '--query-gpu=gpu_uuid,memory.total,utilization.gpu,utilization.memory'
-    ]
-    output = subprocess.check_output(command, encoding='utf8')
-    records = parse_nvidia_output(output)
-    for record in records:
-        record = parse_nvidia_gpu_stats(record)
-        if record.guid == guid:
-            return record
+######
+#
+#   NVIDIA TELEMETRY
+#
+#####
 
 
-def nvidia_process_stats(pid):
-    command = [
-        'nvidia-smi', '--format=csv',
-        '--query-compute-apps=pid,gpu_uuid,used_memory'
-    ]
-    output = subprocess.check_output(command, encoding='utf8')
-    records = parse_nvidia_output(output)
-    for record in records:
-        record = parse_nvidia_process_stats(record)
-        if record.pid == pid:
-            return record
+def parse_nvidia_stream(lines):
+    # nvidia-smi --format=csv, lazy, line by line. Skip header, some
+    # nvidia-smi versions repeat it on every loop
+    header = next(lines, None)
+    for line in lines:
+        line = line.rstrip('\n')
+        if line and line != header.rstrip('\n'):
+            yield line.split(', ')
+
+
+class NvidiaTelemetry:
+    # Each nvidia-smi call costs ~100ms. Instead keep two long-lived
+    # "nvidia-smi --loop-ms" children, nvidia-smi can not mix gpu and
+    # compute apps queries in one call. Reader threads parse CSV and
+    # keep latest records. Records not seen for "stale" seconds are
+    # dropped: nvidia-smi prints nothing when GPU has no processes
+
+    def __init__(self, loop_ms=100, stale=1.0):
+        self.loop_ms = loop_ms
+        self.stale = stale
+
+        self.lock = Lock()
+        self.gpus = {}
+        self.processes = {}
+        self.children = []
+
+    def start(self):
+        queries = [
+            (NVIDIA_GPU_QUERY, parse_nvidia_gpu_stats, self.gpus, 'guid'),
+            (NVIDIA_PROCESS_QUERY, parse_nvidia_process_stats, self.processes, 'pid'),
+        ]
+        for query, parse, index, key in queries:
+            command = [
+                'nvidia-smi', '--format=csv',
+                query,
+                f'--loop-ms={self.loop_ms}'
+            ]
+            try:
+                child = subprocess.Popen(
+                    command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    encoding='utf8'
+                )
+            except FileNotFoundError:
+                # lookups return None, records have null GPU stats
+                log('nvidia-smi not found, no GPU stats')
+                return
+            self.children.append(child)
+
+            thread = Thread(
+                target=self.read,
+                args=(child.stdout, parse, index, key),
+                daemon=True
+            )
+            thread.start()
+
+    def read(self, file, parse, index, key):
+        # Bad line is skipped, reader goes on. Log first error only
+        failed = False
+        for record in parse_nvidia_stream(iter(file)):
+            try:
+                record = parse(record)
+            except (ValueError, KeyError) as error:
+                if not failed:
+                    log(f'Bad nvidia-smi line {record!r}: {error!r}')
+                failed = True
+                continue
+            with self.lock:
+                index[getattr(record, key)] = (monotonic(), record)
+
+    def stop(self):
+        for child in self.children:
+            child.terminate()
+            child.wait()
+        self.children = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def lookup(self, index, key):
+        with self.lock:
+            item = index.get(key)
+        if item:
+            seen, record = item
+            if monotonic() - seen <= self.stale:
+                return record
+
+    def gpu_stats(self, guid):
+        return self.lookup(self.gpus, guid)
+
+    def process_stats(self, pid):
+        return self.lookup(self.processes, pid)
 
 
 #####
@@ -390,6 +931,294 @@ class BenchRecord:
     gpu_usage: float
     gpu_ram: int
 
+    # cpu_usage is cores busy since previous probe, cpu_load is
+    # cpu_usage / number of cores. Old logs have lifetime ps %cpu in
+    # cpu_usage and no cpu_load
+    cpu_load: float = None
+
+    # timestamp is wall clock, use monotonic for durations. missed_ticks
+    # is number of sampling deadlines skipped before this record
+    monotonic: float = None
+    missed_ticks: int = None
+
+    # sums over container root process and all descendants
+    tree_size: int = None
+    tree_cpu_usage: float = None
+    tree_ram: int = None
+
+    # cgroup v2 accounting, see bench --cgroup
+    cgroup_cpu_usage: float = None
+    cgroup_ram: int = None
+    cgroup_peak_ram: int = None
+
+    # watts, whole GPU, not only container processes
+    gpu_power: float = None
+
+    # backends that gave values, see probe_backends
+    probes: list = None
+
+    # VmHWM of root process. Kernel high-water mark, catches spikes
+    # between probes, same as cgroup_peak_ram
+    peak_ram: int = None
+
+    # root process counters since start, /proc/<pid>/{io,stat}. Major
+    # faults are mmap page reads from disk, safetensors, numpy mmap
+    read_bytes: int = None
+    write_bytes: int = None
+    major_faults: int = None
+
+
+@dataclass
+class BenchEvent:
+    event: str
+    timestamp: float
+    monotonic: float
+    value: object = None
+
+
+def bench_event(name, value=None):
+    return BenchEvent(name, time(), monotonic(), value)
+
+
+def drain_queue(queue):
+    while True:
+        try:
+            yield queue.get_nowait()
+        except Empty:
+            break
+
+
+PROC = 'proc'
+CGROUP = 'cgroup'
+NVIDIA = 'nvidia'
+FAKE = 'fake'
+PROBES = [PROC, CGROUP, NVIDIA, FAKE]
+
+
+def probe_cpu_usage(state, key, cpu_time):
+    # Store cpu_time in state.<key>, return usage since previous
+    previous = getattr(state, key)
+    setattr(state, key, cpu_time)
+    if previous:
+        return cpu_usage_delta(previous, cpu_time)
+
+
+class ProcProbe:
+    # /proc/<pid>/*, root process and process tree
+
+    name = PROC
+
+    def __init__(self):
+        self.cpu_time = None
+        self.tree_cpu_times = None
+        self.tree_cpu_time = None
+
+    def start(self, pid):
+        pass
+
+    def stop(self):
+        pass
+
+    def probe(self, pid):
+        # root stat is read once, shared by cpu, ps and tree stats
+        values = {}
+        stat = proc_stat(pid)
+        if not stat:
+            return values
+
+        usage = probe_cpu_usage(self, 'cpu_time', stat_cpu_time(stat))
+        if usage:
+            values.update(cpu_usage=usage.cores, cpu_load=usage.load)
+        values.update(major_faults=stat.majflt)
+
+        stats = proc_ps_stats(pid, stat)
+        if stats:
+            values.update(ram=stats.ram, peak_ram=stats.peak_ram)
+
+        io = proc_io(pid)
+        if io:
+            values.update(read_bytes=io.read_bytes, write_bytes=io.write_bytes)
+
+        stats = proc_tree_ps_stats(pid, stat)
+        if stats:
+            values.update(tree_size=stats.size, tree_ram=stats.ram)
+
+            previous = self.tree_cpu_times or {}
+            delta = tree_cpu_time_delta(previous, stats.cpu_times)
+            self.tree_cpu_times = stats.cpu_times
+
+            # accumulate deltas, so usage is computed same as for pid
+            total = self.tree_cpu_time.cpu_time if self.tree_cpu_time else 0
+            cpu_time = CpuTimeRecord(monotonic(), total + delta)
+            usage = probe_cpu_usage(self, 'tree_cpu_time', cpu_time)
+            if usage:
+                values.update(tree_cpu_usage=usage.cores)
+        return values
+
+
+class CgroupProbe:
+    # cgroup v2 of the container, see bench --cgroup
+
+    name = CGROUP
+
+    def __init__(self):
+        self.dir = None
+        self.cpu_time = None
+
+    def start(self, pid):
+        self.dir = proc_cgroup_dir(pid)
+        if not self.dir:
+            log(f'cgroup v2 dir not found, pid {pid}')
+
+    def stop(self):
+        pass
+
+    def probe(self, pid):
+        if not self.dir:
+            return
+
+        stats = cgroup_stats(self.dir)
+        if not stats:
+            return
+
+        values = dict(cgroup_ram=stats.ram, cgroup_peak_ram=stats.peak_ram)
+        cpu_time = CpuTimeRecord(monotonic(), stats.cpu_time)
+        usage = probe_cpu_usage(self, 'cpu_time', cpu_time)
+        if usage:
+            values.update(cgroup_cpu_usage=usage.cores)
+        return values
+
+
+class NvidiaProbe:
+    # Reads latest NvidiaTelemetry records, no nvidia-smi call per probe
+
+    name = NVIDIA
+
+    def __init__(self):
+        self.telemetry = NvidiaTelemetry()
+
+    def start(self, pid):
+        self.telemetry.start()
+
+    def stop(self):
+        self.telemetry.stop()
+
+    def probe(self, pid):
+        stats = self.telemetry.process_stats(pid)
+        if not stats:
+            return
+
+        # via nvidia-smi can not get both gpu ram and usage in one
+        # call
+        values = dict(gpu_ram=stats.gpu_ram)
+        stats = self.telemetry.gpu_stats(stats.guid)
+        if stats:
+            values.update(gpu_usage=stats.gpu_usage, gpu_power=stats.power)
+        return values
+
+
+class FakeProbe:
+    # Scripted values for tests and dev boxes. JSONL, one line per
+    # probe, BenchRecord fields, last line repeats:
+    # {"gpu_ram": 2545942528, "gpu_usage": 0.43}
+    # {"raise": "nvidia-smi failed"}
+
+    name = FAKE
+
+    def __init__(self, path):
+        self.items = list(load_jsonl(path))
+        self.index = 0
+
+    def start(self, pid):
+        pass
+
+    def stop(self):
+        pass
+
+    def probe(self, pid):
+        item = self.items[min(self.index, len(self.items) - 1)]
+        self.index += 1
+        if 'raise' in item:
+            raise RuntimeError(item['raise'])
+
+        # bench log line works as script, clock and bookkeeping
+        # fields are set by probe_backends
+        names = {_.name for _ in fields(BenchRecord)} - PROBE_BACKENDS_FIELDS
+        return {
+            key: value for key, value in item.items()
+            if key in names
+        }
+
+
+def make_probe(spec):
+    # proc, cgroup, nvidia, fake:path/to/script.jsonl
+    name, _, arg = spec.partition(':')
+    if name == PROC:
+        return ProcProbe()
+    elif name == CGROUP:
+        return CgroupProbe()
+    elif name == NVIDIA:
+        return NvidiaProbe()
+    elif name == FAKE:
+        return FakeProbe(arg)
+    raise ValueError(f'unknown probe {spec!r}, expected one of {PROBES}')
+
+
+def default_probes(cgroup=False, gpu=True):
+    probes = [PROC]
+    if cgroup:
+        probes.append(CGROUP)
+    if gpu:
+        probes.append(NVIDIA)
+    return probes
+
+
+# Kernel high-water marks, only grow while process is alive
+PEAK_KEYS = ['peak_ram', 'cgroup_peak_ram']
+
+
+def update_peaks(peaks, record):
+    # /proc/<pid> and container cgroup are gone after exit, keep the
+    # last values seen
+    for key in PEAK_KEYS:
+        value = getattr(record, key)
+        if value is not None:
+            peaks[key] = value
+
+
+PROBE_BACKENDS_FIELDS = {'timestamp', 'monotonic', 'missed_ticks', 'probes'}
+
+
+def probe_backends(pid, backends, failed):
+    # Failed backend gives nulls, run goes on. Log first failure of
+    # every backend, not every tick
+    values, names = {}, []
+    for backend in backends:
+        try:
+            items = backend.probe(pid)
+        except Exception as error:
+            if backend.name not in failed:
+                log(f'Probe {backend.name!r} failed: {error!r}')
+            failed.add(backend.name)
+            continue
+
+        if items:
+            values.update(items)
+            names.append(backend.name)
+
+    # backend values first, can not override clock and bookkeeping
+    values = dict(
+        dict.fromkeys(['cpu_usage', 'ram', 'gpu_usage', 'gpu_ram']),
+        **values
+    )
+    values.update(
+        timestamp=time(),
+        monotonic=monotonic(),
+        missed_ticks=None,
+        probes=names
+    )
+    return BenchRecord(**values)
+
 
 def task_path(dir, task, split):
     title = TASK_TITLES[task]
@@ -408,25 +1237,89 @@ def bench_input(dir, task, size):
     return islice(cycle(lines), size)
 
 
-def probe_pid(pid):
-    cpu_usage, ram = None, None
-    gpu_usage, gpu_ram = None, None
+def bench_marker(dir, task):
+    lines = bench_input(dir, task, 1)
+    return next(lines)
+
 
-    stats = ps_stats(pid)
-    if stats:
-        cpu_usage = stats.cpu_usage
-        ram = stats.ram
+def feed_lines(lines, file, events, arrivals=None):
+    # Runs in thread alongside sampling. For large input writing
+    # all lines before sampling blocks on full pipe buffer, first
+    # seconds of the run are never probed. With arrivals offsets
+    # feed open loop, see pace_lines
+    count, size = 0, 0
+    events.put(bench_event('feed_start'))
+    scheduled = []
+    if arrivals:
+        lines = pace_lines(lines, arrivals, scheduled)
+    try:
+        for line in lines:
+            data = (line + '\n').encode('utf8')
+            file.write(data)
+            if arrivals:
+                file.flush()
+            count += 1
+            size += len(data)
+        file.close()
+    except BrokenPipeError:
+        log(f'Broken pipe, fed {count} lines')
+
+    if arrivals:
+        events.put(bench_event('arrivals', scheduled))
+
+    # event time is the time of the last write
+    events.put(bench_event('feed_end', {'lines': count, 'bytes': size}))
+
+
+def feed_warm_lines(
+        marker, lines, file, events, first_output, output_end, timeout,
+        arrivals=None
+):
+    # Warm container bench. Feed one marker record, wait for its
+    # prediction, everything before is init. Then feed measured
+    # input. Works only for containers that predict before stdin is
+    # closed. Jiant containers read all input first, marker times
+    # out. Crashed container closes stdout, read_outputs sets both
+    # events, no wait for timeout
+    data = (marker + '\n').encode('utf8')
+    try:
+        file.write(data)
+        file.flush()
+    except BrokenPipeError:
+        log('Broken pipe, marker not fed')
+        return
+    events.put(bench_event('marker_fed'))
 
-    stats = nvidia_process_stats(pid)
-    if stats:
-        gpu_ram = stats.gpu_ram
+    if not first_output.wait(timeout):
+        log(f'No marker prediction in {timeout} sec, container reads all input before predict?')
+        events.put(bench_event('marker_timeout'))
+        file.close()
+        return
 
-        # via nvidia-smi can not get both gpu ram and usage in one
-        # call
-        stats = nvidia_gpu_stats(stats.guid)
-        gpu_usage = stats.gpu_usage
+    if output_end.is_set():
+        log('Container closed stdout, no marker prediction, crashed?')
+        events.put(bench_event('marker_exit'))
+        file.close()
+        return
 
-    return cpu_usage, ram, gpu_usage, gpu_ram
+    events.put(bench_event('init_end'))
+    feed_lines(lines, file, events, arrivals)
+
+
+def read_outputs(file, events, first_output=None, output_end=None):
+    # Model writes one prediction per line. Discard predictions,
+    # keep monotonic time of each line. On EOF wake feed_warm_lines
+    stamps = []
+    for _ in file:
+        stamps.append(round(monotonic(), 4))
+        if len(stamps) == 1:
+            events.put(bench_event('first_output'))
+            if first_output:
+                first_output.set()
+    events.put(bench_event('outputs', stamps))
+    if output_end:
+        output_end.set()
+        first_output.set()
 
 
 def short_uid(cap=5):
@@ -443,47 +1336,405 @@ def gen_name(image):
     return f'{name}_{uid}'
 
 
-def bench_docker(
-        image, data_dir, task,
-        input_size=10000,
-        batch_size=128,
-        delay=0.3
+def bench_command(
+        command, lines,
+        find_pid=None,
+        period=0.3,
+        cgroup=False,
+        marker=None,
+        marker_timeout=600,
+        arrivals=None,
+        gpu=True,
+        env=None,
+        probes=None
 ):
-    lines = bench_input(data_dir, task, input_size)
-    name = gen_name(image)
-    command = [
-        'docker', 'run',
-        '--gpus', 'all',
-        '--interactive', '--rm',
-        '--name', name,
-        image,
-        '--batch-size', str(batch_size)
-    ]
+    # Run any command, feed lines to stdin, probe pid until command
+    # exits. By default probe command process itself, for docker run
+    # find_pid returns container root pid. With marker run warm
+    # container bench, see feed_warm_lines. With arrivals feed open
+    # loop, see feed_lines. env is added to command environment.
+    # probes are backend specs, see make_probe, by default proc +
+    # cgroup if cgroup + nvidia if gpu
+    if env:
+        env = dict(environ, **env)
+
+    yield bench_event('start')
     process = subprocess.Popen(
         command,
         stdin=subprocess.PIPE,
-        stdout=subprocess.DEVNULL,
-        universal_newlines=True
+        stdout=subprocess.PIPE,
+        env=env
     )
-    write_lines(lines, process.stdin)
-    process.stdin.close()
+    events = Queue()
+    first_output, output_end = Event(), Event()
+    if marker is None:
+        target = feed_lines
+        args = (lines, process.stdin, events, arrivals)
+    else:
+        target = feed_warm_lines
+        args = (
+            marker, lines, process.stdin, events,
+            first_output, output_end, marker_timeout, arrivals
+        )
+    feeder = Thread(target=target, args=args, daemon=True)
+    feeder.start()
+    reader = Thread(
+        target=read_outputs,
+        args=(process.stdout, events, first_output, output_end),
+        daemon=True
+    )
+    reader.start()
+
+    if find_pid:
+        pid = find_pid()
+    else:
+        pid = process.pid
+
+    if probes is None:
+        probes = default_probes(cgroup, gpu)
+    backends = [make_probe(_) for _ in probes]
+    for backend in backends:
+        backend.start(pid)
+
+    missed, failed, peaks = 0, set(), {}
+    try:
+        for tick in fixed_rate_ticks(period):
+            if process.poll() is not None:
+                break
+
+            record = probe_backends(pid, backends, failed)
+            record.missed_ticks = tick.missed
+            missed += tick.missed
+            update_peaks(peaks, record)
+            yield record
+            yield from drain_queue(events)
+    finally:
+        for backend in backends:
+            backend.stop()
+
+    feeder.join()
+    reader.join()
+    yield from drain_queue(events)
+    if peaks:
+        # {"event": "peaks", ..., "value": {"peak_ram": 1709469376, "cgroup_peak_ram": 2147483648}}
+        yield bench_event('peaks', peaks)
+    yield bench_event('exit', process.wait())
+
+    if missed:
+        log(f'Missed {missed} ticks, period={period}')
+
+
+# torch intra-op pool, numpy/sklearn BLAS read these on import
+THREAD_ENVS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+
+def thread_env(threads):
+    return {
+        _: str(threads)
+        for _ in THREAD_ENVS
+    }
+
 
+def find_container_pid(name):
     pid = retriable(docker_find_pid, name)
     if not pid:
         raise RuntimeError(f'pid not found, container {name!r}')
+    return pid
 
-    while process.poll() is None:
-        cpu_usage, ram, gpu_usage, gpu_ram = probe_pid(pid)
-        timestamp = time()
 
-        yield BenchRecord(
-            timestamp=timestamp,
-            cpu_usage=cpu_usage,
-            ram=ram,
-            gpu_usage=gpu_usage,
-            gpu_ram=gpu_ram
-        )
-        sleep(delay)
+def bench_docker(
+        image, data_dir, task,
+        input_size=10000,
+        batch_size=128,
+        period=0.3,
+        cgroup=False,
+        gpus='all',
+        warm=False,
+        marker_timeout=600,
+        arrivals=None,
+        lines=None,
+        threads=None,
+        cpuset=None,
+        probes=None
+):
+    # lines override val records, see synth_items. gpus=None is CPU
+    # only bench, threads and cpuset limit CPU inference
+    if lines is None:
+        lines = bench_input(data_dir, task, input_size)
+    marker = bench_marker(data_dir, task) if warm else None
+    name = gen_name(image)
+    command = ['docker', 'run']
+    if gpus:
+        command += ['--gpus', gpus]
+    if cpuset:
+        command += ['--cpuset-cpus', cpuset]
+    if threads:
+        for key, value in thread_env(threads).items():
+            command += ['--env', f'{key}={value}']
+    command += [
+        '--interactive', '--rm',
+        '--name', name,
+        image,
+        '--batch-size', str(batch_size)
+    ]
+    return bench_command(
+        command, lines,
+        find_pid=partial(find_container_pid, name),
+        period=period,
+        cgroup=cgroup,
+        marker=marker,
+        marker_timeout=marker_timeout,
+        arrivals=arrivals,
+        gpu=bool(gpus),
+        probes=probes
+    )
+
+
+def bench_cmd(
+        command, data_dir, task,
+        input_size=10000,
+        period=0.3,
+        cgroup=False,
+        warm=False,
+        marker_timeout=600,
+        arrivals=None,
+        gpu=True,
+        threads=None,
+        cpuset=None,
+        probes=None
+):
+    # Profile tfidf/main.py infer, jiant/main.py infer on dev box
+    # without building images. Command handles batch size itself
+    lines = bench_input(data_dir, task, input_size)
+    marker = bench_marker(data_dir, task) if warm else None
+    if cpuset:
+        command = ['taskset', '--cpu-list', cpuset] + command
+    env = thread_env(threads) if threads else None
+    return bench_command(
+        command, lines,
+        period=period,
+        cgroup=cgroup,
+        marker=marker,
+        marker_timeout=marker_timeout,
+        arrivals=arrivals,
+        gpu=gpu,
+        env=env,
+        probes=probes
+    )
+
+
+#######
+#
+#   MATRIX
+#
+#####
+
+
+@dataclass
+class BenchCell:
+    model: str
+    task: str
+    input_size: int
+    batch_size: int
+    index: int
+
+
+def bench_cell_path(dir, cell):
+    # Same layout as bench/data/jiant, see list_bench_registry in
+    # top level main.py
+    filename = f'{cell.input_size}_{cell.batch_size}_{cell.index:02d}.jsonl'
+    return join(dir, cell.model, cell.task, filename)
+
+
+def bench_matrix_cells(models, tasks, input_sizes, batch_sizes, repeats):
+    for model in models:
+        for task in tasks:
+            for input_size in input_sizes:
+                # 1 record runs estimate init time and model size,
+                # 1_32 same as 1_1
+                sizes = [1] if input_size == 1 else batch_sizes
+                for batch_size in sizes:
+                    for index in range(1, repeats + 1):
+                        yield BenchCell(
+                            model, task,
+                            input_size, batch_size, index
+                        )
+
+
+def bench_matrix_groups(models, tasks, input_sizes, batch_sizes):
+    for model in models:
+        for task in tasks:
+            for input_size in input_sizes:
+                if input_size > 1:
+                    for batch_size in batch_sizes:
+                        yield model, task, input_size, batch_size
+
+
+def scan_bench_group(dir, model, task, input_size, batch_size):
+    # 1_1 runs + input_size_batch_size runs
+    dir = join(dir, model, task)
+    if not exists(dir):
+        return
+
+    for filename in sorted(listdir(dir)):
+        path = join(dir, filename)
+        try:
+            _, size, batch = parse_bench_path(path)
+        except ValueError:
+            # .tmp
+            continue
+        if (size, batch) in [(1, 1), (input_size, batch_size)]:
+            yield scan_bench(path)
+
+
+def bench_group_stats(dir, model, task, input_size, batch_size):
+    benches = list(scan_bench_group(dir, model, task, input_size, batch_size))
+    return task_stats(benches)
+
+
+def bench_exit_code(records):
+    for record in records:
+        if isinstance(record, BenchEvent) and record.event == 'exit':
+            return record.value
+
+
+def dump_jsonl_atomic(items, path):
+    # Interrupted run leaves .tmp file, not a truncated log that looks
+    # complete to skip logic and registry
+    tmp = path + '.tmp'
+    dump_jsonl(items, tmp)
+    rename(tmp, path)
+
+
+def docker_device_gpus(device):
+    # 0 -> --gpus device=0
+    if device == 'all':
+        return device
+    return f'device={device}'
+
+
+@dataclass
+class BenchManifestRecord:
+    path: str
+    status: str
+    timestamp: float
+    device: str = None
+    error: str = None
+
+
+class BenchMatrix:
+    # Run cells in thread pool. Every device has per_device slots,
+    # cell takes free slot, runs docker with --gpus device=<device>.
+    # Progress is appended to manifest.jsonl in out dir
+
+    def __init__(
+            self, data_dir, dir,
+            image_pattern='russiannlp/{model}-{task}',
+            devices=['all'], per_device=1,
+            period=0.3, cgroup=False
+    ):
+        self.data_dir = data_dir
+        self.dir = dir
+        self.image_pattern = image_pattern
+        self.devices = devices
+        self.per_device = per_device
+        self.period = period
+        self.cgroup = cgroup
+
+        self.slots = Queue()
+        for device in devices:
+            for _ in range(per_device):
+                self.slots.put(device)
+
+        self.lock = Lock()
+        self.manifest_path = join(dir, 'manifest.jsonl')
+
+    def log_manifest(self, record):
+        line = format_json(asdict(record))
+        with self.lock:
+            with open(self.manifest_path, 'a') as file:
+                file.write(line + '\n')
+
+    def run_cell(self, cell):
+        path = bench_cell_path(self.dir, cell)
+        image = self.image_pattern.format(model=cell.model, task=cell.task)
+
+        device = self.slots.get()
+        try:
+            log(f'Bench {image!r} -> {path!r}, device={device}')
+            records = list(bench_docker(
+                image, self.data_dir, cell.task,
+                input_size=cell.input_size,
+                batch_size=cell.batch_size,
+                period=self.period,
+                cgroup=self.cgroup,
+                gpus=docker_device_gpus(device)
+            ))
+            code = bench_exit_code(records)
+            if code:
+                raise RuntimeError(f'exit code {code}')
+
+            items = (asdict(_) for _ in records)
+            maybe_mkdir(dirname(path))
+            dump_jsonl_atomic(items, path)
+            status, error = 'done', None
+
+        except Exception as error_:
+            log(f'Failed {path!r}: {error_!r}')
+            status, error = 'failed', repr(error_)
+
+        finally:
+            self.slots.put(device)
+
+        self.log_manifest(BenchManifestRecord(
+            path, status, time(),
+            device=device, error=error
+        ))
+        return path, status
+
+    def run(self, cells):
+        maybe_mkdir(self.dir)
+        todo = []
+        for cell in cells:
+            path = bench_cell_path(self.dir, cell)
+            if exists(path):
+                log(f'Skip {path!r}, exists')
+            else:
+                todo.append(cell)
+
+        workers = len(self.devices) * self.per_device
+        with ThreadPoolExecutor(workers) as pool:
+            yield from pool.map(self.run_cell, todo)
+
+    def run_adaptive(self, groups, repeats, target_ci_width, max_repeats):
+        # Add one more 1_1 and input_size_batch_size run to every group
+        # while rps CI relative width > target, see relative_ci_width
+        index = repeats
+        while index < max_repeats:
+            index += 1
+            cells = {}
+            for group in groups:
+                model, task, input_size, batch_size = group
+                try:
+                    stats = bench_group_stats(self.dir, *group)
+                except ValueError as error:
+                    log(f'Skip {group!r}: {error}')
+                    continue
+
+                width = relative_ci_width(stats.rps_ci, stats.rps)
+                if width <= target_ci_width:
+                    continue
+
+                log(f'Repeat {index} {group!r}, rps={stats.rps:.1f}, ci_width={width:.2f}')
+                for cell in [
+                        BenchCell(model, task, 1, 1, index),
+                        BenchCell(model, task, input_size, batch_size, index)
+                ]:
+                    cells[cell.model, cell.task, cell.input_size, cell.batch_size] = cell
+
+            if not cells:
+                break
+            yield from self.run(cells.values())
 
 
 ########
@@ -500,10 +1751,12 @@ class Bench:
     input_size: int
     batch_size: int
     records: [BenchRecord]
+    events: [BenchEvent] = None
+    accumulator: 'BenchStatsAccumulator' = None
 
 
 def parse_bench_path(path):
-    match = re.search(r'([^/]+)/(\d+)_(\d+)_\d+\.jsonl$', path)
+    match = re.search(r'([^/]+)/(\d+)_(\d+)_\d+\.(?:jsonl|npz)$', path)
     if match:
         task, input_size, batch_size = match.groups()
         return task, int(input_size), int(batch_size)
@@ -511,19 +1764,170 @@ def parse_bench_path(path):
     raise ValueError(f'bad path {path!r}')
 
 
+def parse_bench_items(items):
+    # bench log mixes records and events, {"event": "feed_end", ...}
+    records, events = [], []
+    for item in items:
+        if 'event' in item:
+            events.append(BenchEvent(**item))
+        else:
+            records.append(BenchRecord(**item))
+    return records, events
+
+
 def load_bench(path):
     task, input_size, batch_size = parse_bench_path(path)
 
-    items = load_jsonl(path)
-    records = [
-        BenchRecord(**_)
-        for _ in items
+    if path.endswith(NPZ):
+        records, events = load_bench_npz(path)
+    else:
+        items = load_jsonl(path)
+        records, events = parse_bench_items(items)
+
+    return Bench(
+        path,
+        task, input_size, batch_size,
+        records, events
+    )
+
+
+#######
+#
+#   NPZ
+#
+#####
+
+
+NPZ = '.npz'
+JSONL = '.jsonl'
+
+
+def records_array(records):
+    # JSONL repeats all keys on every line, json.loads is slow for
+    # hundreds of runs. Store records as columns, fixed float64 dtype,
+    # NaN for missing values. float64 is exact for ram in bytes
+    import numpy as np
+
+    names = [
+        _.name for _ in fields(BenchRecord)
+        if _.type is not list
     ]
+    rows = [
+        tuple(
+            math.nan if value is None else value
+            for value in (getattr(record, _) for _ in names)
+        )
+        for record in records
+    ]
+    dtype = [(_, 'f8') for _ in names]
+    return np.array(rows, dtype=dtype)
+
+
+def array_records(array):
+    # Files written by older versions may lack some columns
+    size = len(array)
+    columns = []
+    for field in fields(BenchRecord):
+        if field.type is not list and field.name in array.dtype.names:
+            values = array[field.name].tolist()
+            parse = int if field.type is int else float
+            values = [
+                None if value != value else parse(value)  # nan
+                for value in values
+            ]
+        else:
+            values = [None] * size
+        columns.append(values)
+
+    for values in zip(*columns):
+        yield BenchRecord(*values)
+
+
+def dump_bench_npz(records, events, path):
+    import numpy as np
+
+    array = records_array(records)
+    events = np.array(
+        [format_json(asdict(_)) for _ in events],
+        dtype=str
+    )
+    # proc,nvidia, empty for old logs without probes
+    probes = np.array(
+        [','.join(_.probes or []) for _ in records],
+        dtype=str
+    )
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as file:
+        np.savez_compressed(file, records=array, events=events, probes=probes)
+    rename(tmp, path)
+
+
+def load_bench_npz(path):
+    import numpy as np
+
+    with np.load(path) as data:
+        array = data['records']
+        lines = data['events'].tolist()
+        probes = data['probes'].tolist() if 'probes' in data else None
+
+    records = list(array_records(array))
+    if probes:
+        for record, names in zip(records, probes):
+            record.probes = names.split(',') if names else None
+    events = [
+        BenchEvent(**json.loads(_))
+        for _ in lines
+    ]
+    return records, events
+
+
+def list_jsonl_benches(dir):
+    for root, _, filenames in walk(dir):
+        for filename in sorted(filenames):
+            path = join(root, filename)
+            try:
+                parse_bench_path(path)
+            except ValueError:
+                # manifest.jsonl
+                continue
+            if path.endswith(JSONL):
+                yield path
+
+
+def convert_bench(path):
+    target = path[:-len(JSONL)] + NPZ
+    items = load_jsonl(path)
+    records, events = parse_bench_items(items)
+    dump_bench_npz(records, events, target)
+    return target
+
+
+def parse_bench_item(item):
+    if 'event' in item:
+        return BenchEvent(**item)
+    return BenchRecord(**item)
+
+
+def scan_bench(path):
+    # Same as load_bench, but records are not kept, stats are
+    # accumulated while reading
+    task, input_size, batch_size = parse_bench_path(path)
+    if path.endswith(NPZ):
+        records, events = load_bench_npz(path)
+        items = merge_bench_items(records, events)
+    else:
+        items = (parse_bench_item(_) for _ in load_jsonl(path))
+
+    accumulator = BenchStatsAccumulator()
+    for item in items:
+        accumulator.add(item)
 
     return Bench(
         path,
         task, input_size, batch_size,
-        records
+        records=None,
+        events=accumulator.events,
+        accumulator=accumulator
     )
 
 
@@ -593,6 +1997,137 @@ def plot_benches(benches, width=8, height=7):
     return fig
 
 
+#######
+#
+#   TRACE
+#
+######
+
+
+# Chrome trace event format, open in ui.perfetto.dev or
+# chrome://tracing. Counter track, BenchRecord fields, scale
+TRACE_COUNTERS = [
+    ('cpu cores', ['cpu_usage', 'tree_cpu_usage', 'cgroup_cpu_usage'], 1),
+    ('ram mb', ['ram', 'tree_ram', 'cgroup_ram'], 1 / MB),
+    ('gpu usage %', ['gpu_usage'], 100),
+    ('gpu ram mb', ['gpu_ram'], 1 / MB),
+    ('gpu power w', ['gpu_power'], 1),
+]
+
+# per output, inline in counter track, not instant events
+TRACE_SKIP_EVENTS = ['outputs', 'arrivals']
+
+PHASES_TID = 1
+FEED_TID = 2
+
+
+def trace_us(seconds):
+    return round(seconds * 1000000)
+
+
+def bench_phases(bench):
+    # (name, tid, start, end), monotonic. Cold bench has no init_end,
+    # first prediction is init boundary only if model streams. Jiant,
+    # tfidf print all predictions after inference, init and processing
+    # are one "run" span
+    events = bench.events or []
+    start = find_event(events, 'start')
+    init_end = find_event(events, 'init_end')
+    if not init_end and streams_outputs(bench):
+        init_end = find_event(events, 'first_output')
+    outputs = find_event(events, 'outputs')
+    exited = find_event(events, 'exit')
+    feed_start = find_event(events, 'feed_start')
+    feed_end = find_event(events, 'feed_end')
+
+    if start and init_end:
+        yield 'init', PHASES_TID, start.monotonic, init_end.monotonic
+
+    end = None
+    if outputs and outputs.value:
+        end = outputs.value[-1]
+    elif exited:
+        end = exited.monotonic
+    if init_end and end:
+        yield 'processing', PHASES_TID, init_end.monotonic, end
+    elif start and end:
+        yield 'run', PHASES_TID, start.monotonic, end
+
+    if feed_start and feed_end:
+        yield 'feed', FEED_TID, feed_start.monotonic, feed_end.monotonic
+
+
+def bench_trace_events(bench, pid):
+    # One trace process per bench, all runs start at 0 to compare
+    # them side by side. Old logs without monotonic have no events
+    records, events = bench.records, bench.events or []
+    start = find_event(events, 'start')
+    if start:
+        origin = start.monotonic
+    elif records:
+        origin = record_time(records[0])
+    else:
+        return
+
+    yield dict(
+        name='process_name', ph='M', pid=pid,
+        args=dict(name=bench.path)
+    )
+    yield dict(
+        name='process_sort_index', ph='M', pid=pid,
+        args=dict(sort_index=pid)
+    )
+    for tid, name in [(PHASES_TID, 'phases'), (FEED_TID, 'feed')]:
+        yield dict(
+            name='thread_name', ph='M', pid=pid, tid=tid,
+            args=dict(name=name)
+        )
+
+    for record in records:
+        ts = trace_us(record_time(record) - origin)
+        for name, keys, scale in TRACE_COUNTERS:
+            args = {
+                key: getattr(record, key) * scale
+                for key in keys
+                if getattr(record, key) is not None
+            }
+            if args:
+                yield dict(name=name, ph='C', ts=ts, pid=pid, args=args)
+
+    for name, tid, start, end in bench_phases(bench):
+        yield dict(
+            name=name, ph='X', pid=pid, tid=tid,
+            ts=trace_us(start - origin),
+            dur=trace_us(end - start)
+        )
+
+    for event in events:
+        if event.event not in TRACE_SKIP_EVENTS:
+            yield dict(
+                name=event.event, ph='i', s='t',
+                pid=pid, tid=PHASES_TID,
+                ts=trace_us(event.monotonic - origin),
+                args=dict(value=event.value)
+            )
+
+    # cumulative count, slope is output rps
+    outputs = find_event(events, 'outputs')
+    if outputs:
+        for index, stamp in enumerate(outputs.value):
+            yield dict(
+                name='outputs', ph='C', pid=pid,
+                ts=trace_us(stamp - origin),
+                args=dict(outputs=index + 1)
+            )
+
+
+def bench_trace(benches):
+    events = []
+    for index, bench in enumerate(benches):
+        events.extend(bench_trace_events(bench, pid=index + 1))
+    return dict(traceEvents=events, displayTimeUnit='ms')
+
+
 ######
 #
 #   STATS
@@ -605,6 +2140,53 @@ class BenchStats:
     input_size: int
     total_time: int
     max_gpu_ram: int
+    gpu_time: float = None
+    mean_cpu_usage: float = None
+    mean_ram: float = None
+    mean_gpu_usage: float = None
+
+    # joules, gpu_power integrated over run
+    energy: float = None
+
+    # RSS of root process, sum over process tree
+    max_ram: int = None
+    max_tree_ram: int = None
+
+    # sampled max vs kernel high-water mark, see PEAK_KEYS. Sampled
+    # max misses spikes shorter than period
+    peak_ram: int = None
+    max_cgroup_ram: int = None
+    cgroup_peak_ram: int = None
+
+    # last values of root process counters, see IO_KEYS
+    read_bytes: int = None
+    write_bytes: int = None
+    major_faults: int = None
+
+    # seconds of record intervals where read_bytes grew
+    read_time: float = None
+
+
+@dataclass
+class PhaseStats:
+    init_time: float
+    proc_time: float
+    init_max_gpu_ram: int
+    proc_energy: float = None
+
+    # counters at init_end, None without /proc/<pid>/io
+    init_read_bytes: int = None
+    init_major_faults: int = None
+    init_read_time: float = None
+
+
+@dataclass
+class OutputStats:
+    first_output_time: float
+    rps: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
 
 
 @dataclass
@@ -612,56 +2194,1880 @@ class TaskStats:
     task: str
     gpu_ram: int
     rps: int
+    init_time: float = None
+
+    # from model stdout timestamps, see output_stats
+    first_output_time: float = None
+    output_rps: float = None
+    output_latency_p50: float = None
+    output_latency_p95: float = None
+    output_latency_p99: float = None
+
+    # [lower, upper] bootstrap 95% confidence intervals of medians,
+    # see bootstrap_ci
+    gpu_ram_ci: list = None
+    rps_ci: list = None
+    init_time_ci: list = None
+
+    # processing phase energy, see task_samples
+    records_per_joule: float = None
+    joules_per_record: float = None
+
+    # gb, median over input_size > 1 repeats, sampled max next to
+    # kernel peak, see BenchStats
+    max_ram: float = None
+    peak_ram: float = None
+    max_cgroup_ram: float = None
+    cgroup_peak_ram: float = None
+
+    # output rate without warm-up and tail, see steady_stats
+    steady_rps: float = None
+    warmup_time: float = None
+    tail_time: float = None
+
+    # gb read from disk during init, seconds with reads and gb/s
+    # over these seconds, is init I/O or CPU bound? Bandwidth close
+    # to disk sequential read rate and read time close to init time
+    # means disk bound. Low bandwidth means model files are read in
+    # small chunks, 0 read means page cache hit
+    init_read: float = None
+    init_read_time: float = None
+    init_read_bandwidth: float = None
+    init_major_faults: int = None
+
+
+@dataclass
+class TaskSamples:
+    # One value per repeat, see task_samples
+    gpu_rams: list
+    init_times: list
+    rpses: list
+
+    # (input_size, total_time) of input_size > 1 runs when rps
+    # is calibrated by 1_1 init time
+    runs: list = None
+
+    # records / joules of processing phase, None without gpu_power
+    records_per_joules: list = None
+
+    # bytes read and major faults during init, None without
+    # /proc/<pid>/io
+    init_read_bytes: list = None
+    init_major_faults: list = None
+    init_read_times: list = None
+
+
+def record_time(record):
+    # old logs have no monotonic
+    if record.monotonic is not None:
+        return record.monotonic
+    return record.timestamp
+
+
+class SeriesBuckets:
+    # Constant memory time series for steady_stats. At most size
+    # buckets of mean (time, value), when full adjacent buckets are
+    # merged, bucket width doubles. Hour long run at 50 Hz is 256
+    # buckets of ~1 sec
+
+    def __init__(self, size=256):
+        self.size = size
+        self.width = 1
+        self.buckets = []
+
+    def add(self, time, value):
+        if self.buckets and self.buckets[-1][2] < self.width:
+            bucket = self.buckets[-1]
+            bucket[0] += time
+            bucket[1] += value
+            bucket[2] += 1
+        else:
+            self.buckets.append([time, value, 1])
+
+        if len(self.buckets) > self.size:
+            self.buckets = [
+                [
+                    sum(_[0] for _ in pair),
+                    sum(_[1] for _ in pair),
+                    sum(_[2] for _ in pair)
+                ]
+                for pair in (
+                    self.buckets[index:index + 2]
+                    for index in range(0, len(self.buckets), 2)
+                )
+            ]
+            self.width *= 2
+
+    def series(self):
+        return [
+            (time / count, value / count)
+            for time, value, count in self.buckets
+        ]
+
+
+class BenchStatsAccumulator:
+    # One pass over records, constant memory. Hour long runs at
+    # 50 Hz do not fit in lists of dataclasses. Keeps events, there
+    # are few of them
+
+    MEAN_KEYS = ['cpu_usage', 'ram', 'gpu_usage']
+    MAX_KEYS = ['ram', 'tree_ram', 'cgroup_ram'] + PEAK_KEYS
+
+    # counters, keep last value and value at init_end
+    IO_KEYS = ['read_bytes', 'write_bytes', 'major_faults']
+
+    def __init__(self, gpu_usage_treshold=0.1):
+        self.gpu_usage_treshold = gpu_usage_treshold
+
+        self.count = 0
+        self.first_time = None
+        self.last_time = None
+        self.gpu_time = 0
+
+        # (time, gpu_ram) every time max grows, to get max before
+        # init end, see phase_stats
+        self.max_gpu_ram = 0
+        self.gpu_ram_peaks = []
+        self.gpu_usages = SeriesBuckets()
+
+        self.sums = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.maxes = {}
+
+        # from peaks event, old logs and npz fall back to max over
+        # records, same values since marks only grow
+        self.peaks = {}
+        self.io = {}
+        self.init_io = None
+        self.read_time = 0
+        self.init_read_time = None
+
+        # joules, power of a record is held over interval before it,
+        # same as gpu_time. init_energy is energy at init_end event
+        # time. Live log has event after record of the same tick, npz
+        # has them sorted, cut record interval at event time
+        self.energy = None
+        self.init_energy = None
+        self.init_end_time = None
+        self.last_power = None
+
+        self.events = []
+
+    def add(self, item):
+        if isinstance(item, BenchEvent):
+            self.events.append(item)
+            if item.event == 'peaks':
+                self.peaks = item.value
+            elif item.event == 'init_end':
+                self.init_io = dict(self.io)
+                self.init_read_time = self.read_time
+                if self.last_time is not None and self.last_time > item.monotonic:
+                    # record interval crosses event
+                    overshoot = self.last_time - item.monotonic
+                    self.init_energy = (self.energy or 0) - self.last_power * overshoot
+                else:
+                    # wait for next record
+                    self.init_end_time = item.monotonic
+            return
+
+        time = record_time(item)
+        if self.first_time is None:
+            self.first_time = time
+        else:
+            if (
+                    item.gpu_usage
+                    and item.gpu_usage >= self.gpu_usage_treshold
+            ):
+                self.gpu_time += time - self.last_time
+            if (
+                    item.read_bytes is not None
+                    and item.read_bytes > self.io.get('read_bytes', item.read_bytes)
+            ):
+                self.read_time += time - self.last_time
+            if item.gpu_power is not None:
+                if self.init_end_time is not None:
+                    self.init_energy = (
+                        (self.energy or 0)
+                        + item.gpu_power * (self.init_end_time - self.last_time)
+                    )
+                    self.init_end_time = None
+                self.energy = (
+                    (self.energy or 0)
+                    + item.gpu_power * (time - self.last_time)
+                )
+        self.last_power = item.gpu_power or 0
+        self.last_time = time
+        self.count += 1
+
+        if item.gpu_usage is not None:
+            self.gpu_usages.add(time, item.gpu_usage)
+
+        if item.gpu_ram and item.gpu_ram > self.max_gpu_ram:
+            self.max_gpu_ram = item.gpu_ram
+            self.gpu_ram_peaks.append((time, item.gpu_ram))
+
+        for key in self.MEAN_KEYS:
+            value = getattr(item, key)
+            if value is not None:
+                self.sums[key] += value
+                self.counts[key] += 1
+
+        for key in self.MAX_KEYS:
+            value = getattr(item, key)
+            if value is not None and value > self.maxes.get(key, 0):
+                self.maxes[key] = value
+
+        for key in self.IO_KEYS:
+            value = getattr(item, key)
+            if value is not None:
+                self.io[key] = value
+
+    def mean(self, key):
+        if self.counts[key]:
+            return self.sums[key] / self.counts[key]
+
+    def max_gpu_ram_until(self, time):
+        value = 0
+        for peak_time, gpu_ram in self.gpu_ram_peaks:
+            if peak_time > time:
+                break
+            value = gpu_ram
+        return value
+
+    def peak(self, key):
+        value = self.peaks.get(key)
+        if value is not None:
+            return value
+        return self.maxes.get(key)
+
+    def stats(self, input_size=None):
+        return BenchStats(
+            input_size,
+            total_time=self.last_time - self.first_time,
+            max_gpu_ram=self.max_gpu_ram,
+            gpu_time=self.gpu_time,
+            mean_cpu_usage=self.mean('cpu_usage'),
+            mean_ram=self.mean('ram'),
+            mean_gpu_usage=self.mean('gpu_usage'),
+            energy=self.energy,
+            max_ram=self.maxes.get('ram'),
+            max_tree_ram=self.maxes.get('tree_ram'),
+            peak_ram=self.peak('peak_ram'),
+            max_cgroup_ram=self.maxes.get('cgroup_ram'),
+            cgroup_peak_ram=self.peak('cgroup_peak_ram'),
+            read_bytes=self.io.get('read_bytes'),
+            write_bytes=self.io.get('write_bytes'),
+            major_faults=self.io.get('major_faults'),
+            read_time=self.read_time if 'read_bytes' in self.io else None
+        )
 
 
-def bench_stats(bench, gpu_usage_treshold=0.1):
-    if not bench.records:
+def merge_bench_items(records, events):
+    # Back to log order, events among records, see init_energy
+    return sorted(records + events, key=record_time)
+
+
+def bench_accumulator(bench):
+    # Streamed benches come with accumulator, see scan_bench
+    if bench.accumulator is None:
+        accumulator = BenchStatsAccumulator()
+        for item in merge_bench_items(bench.records, bench.events or []):
+            accumulator.add(item)
+        bench.accumulator = accumulator
+    return bench.accumulator
+
+
+def accumulate(items, accumulator):
+    # Live stats while bench runs
+    for item in items:
+        accumulator.add(item)
+        yield item
+
+
+def log_bench_stats(accumulator):
+    if accumulator.count:
+        stats = accumulator.stats()
+        message = (
+            f'Total time {stats.total_time:.1f}s, '
+            f'gpu time {stats.gpu_time:.1f}s, '
+            f'max gpu ram {stats.max_gpu_ram / GB:.2f}gb'
+        )
+        if stats.energy is not None:
+            message += f', gpu energy {stats.energy:.0f}J'
+        if stats.peak_ram is not None:
+            message += (
+                f', max ram {(stats.max_ram or 0) / GB:.2f}gb'
+                f', peak ram {stats.peak_ram / GB:.2f}gb'
+            )
+        log(message)
+
+
+def bench_stats(bench):
+    accumulator = bench_accumulator(bench)
+    if not accumulator.count:
         raise ValueError(f'no bench records {bench.path}')
+    return accumulator.stats(bench.input_size)
+
+
+def find_event(events, name):
+    for event in events or []:
+        if event.event == name:
+            return event
+
+
+def percentiles(values, qs):
+    # 0.95 -> 95th of 99 cut points
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return [cuts[int(_ * 100) - 1] for _ in qs]
+
+
+def output_stats(bench):
+    start = find_event(bench.events, 'start')
+    init_end = find_event(bench.events, 'init_end')
+    outputs = find_event(bench.events, 'outputs')
+    if not start or not outputs:
+        return
 
-    total_time = (
-        bench.records[-1].timestamp
-        - bench.records[0].timestamp
+    stamps = outputs.value
+    begin = start.monotonic
+    if init_end:
+        # marker prediction, measured input is fed after init_end
+        stamps = stamps[1:]
+        begin = init_end.monotonic
+    if len(stamps) < 3:
+        return
+
+    first_output_time = stamps[0] - begin
+
+    # steady state, init is before first output
+    rps = (len(stamps) - 1) / (stamps[-1] - stamps[0] or 1e-9)
+
+    # time between consecutive predictions
+    latencies = [
+        next - previous
+        for previous, next in zip(stamps, stamps[1:])
+    ]
+    p50, p95, p99 = percentiles(latencies, [0.5, 0.95, 0.99])
+    return OutputStats(first_output_time, rps, p50, p95, p99)
+
+
+def streams_outputs(bench):
+    # Model prints predictions while input is still fed. Input
+    # smaller than pipe buffer (64kb) is fed at once, looks like
+    # not streaming, use --input-size 2000
+    outputs = find_event(bench.events, 'outputs')
+    first_output = find_event(bench.events, 'first_output')
+    feed_end = find_event(bench.events, 'feed_end')
+    return (
+        outputs and len(outputs.value) >= 3
+        and first_output and feed_end
+        and first_output.monotonic < feed_end.monotonic
     )
-    max_gpu_ram = max(
-        _.gpu_ram or 0
-        for _ in bench.records
+
+
+@dataclass
+class SteadyStats:
+    # seconds, processing = warmup + steady + tail, see steady_stats.
+    # rps is None for burst output, no rate
+    warmup_time: float
+    steady_time: float
+    tail_time: float
+    rps: float
+
+
+def segment_cost(sums, squares, start, end):
+    # squared deviations from mean of values[start:end]
+    total = sums[end] - sums[start]
+    return squares[end] - squares[start] - total * total / (end - start)
+
+
+def change_points(values, penalty, min_size=3):
+    # Binary segmentation, mean shift model. Split segment where cost
+    # drops most, stop when drop is below penalty
+    sums, squares = [0], [0]
+    for value in values:
+        sums.append(sums[-1] + value)
+        squares.append(squares[-1] + value * value)
+
+    points = []
+    segments = [(0, len(values))]
+    while segments:
+        start, end = segments.pop()
+        cost = segment_cost(sums, squares, start, end)
+        best, split = penalty, None
+        for index in range(start + min_size, end - min_size + 1):
+            gain = (
+                cost
+                - segment_cost(sums, squares, start, index)
+                - segment_cost(sums, squares, index, end)
+            )
+            if gain > best:
+                best, split = gain, index
+        if split:
+            points.append(split)
+            segments.extend([(start, split), (split, end)])
+    return sorted(points)
+
+
+def change_penalty(values):
+    # BIC 2 sigma^2 log n. Sigma from median abs difference of
+    # neighbours, level shifts do not inflate it
+    diffs = [abs(next - previous) for previous, next in zip(values, values[1:])]
+    sigma = statistics.median(diffs) / (0.6745 * math.sqrt(2))
+    return 2 * max(sigma * sigma, 1e-9) * math.log(len(values))
+
+
+def steady_window(values, tolerance=0.1, min_size=3):
+    # (start, end) indices. Steady level is mean of the segment with
+    # most work, size * mean: most outputs, most busy GPU time. Short
+    # spikes and long idle tails lose. Extended by neighbour segments
+    # within tolerance
+    points = change_points(values, change_penalty(values), min_size)
+    bounds = [0] + points + [len(values)]
+    segments = list(zip(bounds, bounds[1:]))
+    means = [
+        statistics.mean(values[start:end])
+        for start, end in segments
+    ]
+    index = max(
+        range(len(segments)),
+        key=lambda _: (segments[_][1] - segments[_][0]) * means[_]
     )
-    return BenchStats(
-        bench.input_size,
-        total_time,
-        max_gpu_ram
+    level = means[index]
+    first = last = index
+    while first > 0 and abs(means[first - 1] - level) <= tolerance * level:
+        first -= 1
+    while last < len(segments) - 1 and abs(means[last + 1] - level) <= tolerance * level:
+        last += 1
+    return segments[first][0], segments[last][1]
+
+
+def output_rate_series(stamps, begin, end):
+    # ~20 outputs per bin, rate noise is ~20%
+    size = min(100, max(10, len(stamps) // 20))
+    width = (end - begin) / size
+    counts = [0] * size
+    for stamp in stamps:
+        index = min(int((stamp - begin) / width), size - 1)
+        counts[index] += 1
+
+    times = [begin + _ * width for _ in range(size + 1)]
+    return times, [_ / width for _ in counts]
+
+
+def steady_stats(bench, tolerance=0.1, min_size=3):
+    # Processing includes CUDA warm-up, cudnn autotuning of first
+    # batches, last partial batch. Find steady window with change
+    # points in output rate and gpu usage, intersect the two. Warm
+    # bench: processing is from init_end to last output. Cold bench
+    # that streams: from first output, gpu usage is scanned from
+    # start, low init segment is cut. Jiant, tfidf print all
+    # predictions at once, one burst has no rate, see
+    # burst_steady_stats. Old logs have no events, gpu usage over
+    # whole run
+    start = find_event(bench.events, 'start')
+    init_end = find_event(bench.events, 'init_end')
+    outputs = find_event(bench.events, 'outputs')
+    if not outputs:
+        accumulator = bench_accumulator(bench)
+        if not start and accumulator.count:
+            return burst_steady_stats(
+                bench, accumulator.first_time, accumulator.last_time,
+                tolerance, min_size
+            )
+        return
+    if len(outputs.value) < 3:
+        return
+
+    stamps = outputs.value
+    if init_end:
+        # marker prediction
+        stamps = stamps[1:]
+        begin = proc_begin = init_end.monotonic
+    elif start and streams_outputs(bench):
+        begin = start.monotonic
+        proc_begin = stamps[0]
+    elif start:
+        return burst_steady_stats(bench, start.monotonic, stamps[0], tolerance, min_size)
+    else:
+        return
+
+    end = stamps[-1]
+    if len(stamps) < 3 or end <= proc_begin:
+        return
+
+    times, values = output_rate_series(stamps, proc_begin, end)
+    start, stop = steady_window(values, tolerance, min_size)
+    windows = [(times[start], times[stop])]
+
+    accumulator = bench_accumulator(bench)
+    usages = [
+        (time, gpu_usage)
+        for time, gpu_usage in accumulator.gpu_usages.series()
+        if begin <= time <= end
+    ]
+    if len(usages) >= 2 * min_size and any(gpu_usage for _, gpu_usage in usages):
+        times = [time for time, _ in usages]
+        values = [gpu_usage for _, gpu_usage in usages]
+        start, stop = steady_window(values, tolerance, min_size)
+        windows.append((times[start], times[stop - 1]))
+
+    start = max(start for start, _ in windows)
+    stop = min(stop for _, stop in windows)
+    if stop <= start:
+        # gpu usage disagrees, trust outputs
+        start, stop = windows[0]
+
+    count = sum(start <= _ <= stop for _ in stamps)
+    return SteadyStats(
+        warmup_time=max(start - proc_begin, 0),
+        steady_time=stop - start,
+        tail_time=end - stop,
+        rps=count / (stop - start)
     )
 
 
-def task_stats(benches):
+def burst_steady_stats(bench, begin, end, tolerance=0.1, min_size=3):
+    # Gpu usage only, from start to first output of the burst or
+    # end of old log.
+    # Processing starts at busy run that leads into steady window,
+    # short busy spikes of CUDA init are cut
+    accumulator = bench_accumulator(bench)
+    usages = [
+        (time, gpu_usage)
+        for time, gpu_usage in accumulator.gpu_usages.series()
+        if begin <= time <= end
+    ]
+    if len(usages) < 2 * min_size or not any(gpu_usage for _, gpu_usage in usages):
+        return
+
+    times = [time for time, _ in usages]
+    values = [gpu_usage for _, gpu_usage in usages]
+    start, stop = steady_window(values, tolerance, min_size)
+    index = start
+    while index > 0 and values[index - 1] >= accumulator.gpu_usage_treshold:
+        index -= 1
+
+    return SteadyStats(
+        warmup_time=times[start] - times[index],
+        steady_time=times[stop - 1] - times[start],
+        tail_time=end - times[stop - 1],
+        rps=None
+    )
+
+
+@dataclass
+class LoadStats:
+    rate: float
+    rps: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    saturated: bool
+
+
+def load_stats(bench, rate, tolerance=0.1):
+    # Open loop bench, latency is from scheduled arrival to prediction.
+    # Model writes predictions in input order. Saturated when model
+    # does not keep up with offered rate, queue grows
+    arrivals = find_event(bench.events, 'arrivals')
+    outputs = find_event(bench.events, 'outputs')
+    if not arrivals or not outputs:
+        return
+
+    stamps = outputs.value
+    if find_event(bench.events, 'init_end'):
+        # marker prediction
+        stamps = stamps[1:]
+
+    arrivals = arrivals.value
+    if len(arrivals) < 3 or len(stamps) < 3:
+        return
+
+    latencies = [
+        output - arrival
+        for arrival, output in zip(arrivals, stamps)
+    ]
+    p50, p95, p99 = percentiles(latencies, [0.5, 0.95, 0.99])
+
+    # poisson arrivals, offered rate differs from target rate
+    offered = (len(arrivals) - 1) / (arrivals[-1] - arrivals[0] or 1e-9)
+    rps = (len(stamps) - 1) / (stamps[-1] - stamps[0] or 1e-9)
+    saturated = (
+        rps < (1 - tolerance) * offered
+        or len(stamps) < len(arrivals)
+    )
+    return LoadStats(rate, rps, p50, p95, p99, saturated)
+
+
+def phase_stats(bench):
+    # Warm bench has explicit init/processing boundary. Init is from
+    # start to marker prediction, processing from init end to last
+    # prediction
+    start = find_event(bench.events, 'start')
+    init_end = find_event(bench.events, 'init_end')
+    outputs = find_event(bench.events, 'outputs')
+    if not start or not init_end or not outputs or len(outputs.value) < 2:
+        return
+
+    init_time = init_end.monotonic - start.monotonic
+    proc_time = outputs.value[-1] - init_end.monotonic
+    accumulator = bench_accumulator(bench)
+    init_max_gpu_ram = accumulator.max_gpu_ram_until(init_end.monotonic)
+
+    proc_energy = None
+    if accumulator.energy is not None:
+        proc_energy = accumulator.energy - (accumulator.init_energy or 0)
+
+    init_io = accumulator.init_io or {}
+    init_read_time = None
+    if 'read_bytes' in init_io:
+        init_read_time = accumulator.init_read_time
+    return PhaseStats(
+        init_time, proc_time, init_max_gpu_ram, proc_energy,
+        init_read_bytes=init_io.get('read_bytes'),
+        init_major_faults=init_io.get('major_faults'),
+        init_read_time=init_read_time
+    )
+
+
+def bootstrap_ci(samples, statistic, size=1000, level=0.95, seed=1):
+    # Percentile bootstrap. Every sample is resampled independently,
+    # statistic(*resamples) is computed size times. Fixed seed so
+    # stats output is reproducible
+    random = Random(seed)
+    values = []
+    for _ in range(size):
+        resamples = [
+            random.choices(sample, k=len(sample))
+            for sample in samples
+        ]
+        values.append(statistic(*resamples))
+
+    values.sort()
+    alpha = (1 - level) / 2
+    bounds = [
+        values[round(alpha * (size - 1))],
+        values[round((1 - alpha) * (size - 1))]
+    ]
+    # inf -> None, unbounded
+    return [
+        None if math.isinf(_) else _
+        for _ in bounds
+    ]
+
+
+def median_ci(values, **kwargs):
+    return bootstrap_ci([values], statistics.median, **kwargs)
+
+
+def relative_ci_width(ci, value):
+    # [95, 105], 100 -> 0.1
+    lower, upper = ci
+    if lower is None or upper is None:
+        return math.inf
+    return (upper - lower) / value
+
+
+def calibrated_rps(init_times, runs):
+    # runs are (input_size, total_time) from input_size > 1 benches.
+    # Slow init resample may eat all processing time, rps is inf then
+    init_time = statistics.median(init_times)
+    return statistics.median(
+        size / (total_time - init_time)
+        if total_time > init_time else math.inf
+        for size, total_time in runs
+    )
+
+
+def task_samples(benches):
     tasks = {_.task for _ in benches}
     if len(tasks) > 1:
         raise ValueError('multiple tasks {sorted(tasks)}')
 
-    if not any(_.input_size == 1 for _ in benches):
-        raise ValueError('no input_size == 1 benches')
-
     if not any(_.input_size > 1 for _ in benches):
         raise ValueError('not input_size > 1 benches')
 
-    stats = [
-        bench_stats(_) for _ in benches
-        if _.input_size == 1
+    phases = [
+        (_.input_size, phase_stats(_)) for _ in benches
+        if _.input_size > 1
     ]
-    gpu_ram = statistics.median(_.max_gpu_ram for _ in stats)
-    init_time = statistics.median(_.total_time for _ in stats)
+    phases = [(size, stats) for size, stats in phases if stats]
+
+    if phases:
+        # warm benches, init and processing measured in one run
+        records_per_joules = None
+        if all(stats.proc_energy for _, stats in phases):
+            records_per_joules = [
+                size / stats.proc_energy
+                for size, stats in phases
+            ]
+        return TaskSamples(
+            gpu_rams=[stats.init_max_gpu_ram for _, stats in phases],
+            init_times=[stats.init_time for _, stats in phases],
+            rpses=[size / stats.proc_time for size, stats in phases],
+            records_per_joules=records_per_joules,
+            init_read_bytes=[stats.init_read_bytes for _, stats in phases],
+            init_major_faults=[stats.init_major_faults for _, stats in phases],
+            init_read_times=[stats.init_read_time for _, stats in phases]
+        )
+
+    elif any(_.input_size == 1 for _ in benches):
+        stats = [
+            bench_stats(_) for _ in benches
+            if _.input_size == 1
+        ]
+        gpu_rams = [_.max_gpu_ram for _ in stats]
+        init_times = [_.total_time for _ in stats]
+        init_energies = [_.energy for _ in stats]
+
+        # 1_1 run is all init
+        init_read_bytes = [_.read_bytes for _ in stats]
+        init_major_faults = [_.major_faults for _ in stats]
+        init_read_times = [_.read_time for _ in stats]
+
+        stats = [
+            bench_stats(_) for _ in benches
+            if _.input_size > 1
+        ]
+        runs = [(_.input_size, _.total_time) for _ in stats]
+        init_time = statistics.median(init_times)
+
+        # processing energy same as time, total - median 1_1
+        records_per_joules = None
+        if all(_ is not None for _ in init_energies + [_.energy for _ in stats]):
+            init_energy = statistics.median(init_energies)
+            records_per_joules = [
+                _.input_size / (_.energy - init_energy)
+                for _ in stats
+            ]
+        return TaskSamples(
+            gpu_rams, init_times,
+            rpses=[
+                size / (total_time - init_time)
+                for size, total_time in runs
+            ],
+            runs=runs,
+            records_per_joules=records_per_joules,
+            init_read_bytes=init_read_bytes,
+            init_major_faults=init_major_faults,
+            init_read_times=init_read_times
+        )
+
+    benches = [_ for _ in benches if _.input_size > 1]
+    if all(streams_outputs(_) for _ in benches):
+        # no 1_1 calibration runs, processing speed is measured
+        # directly from model stdout. Model RAM is max before first
+        # prediction, same as init_max_gpu_ram of warm benches
+        outputs = [output_stats(_) for _ in benches]
+        gpu_rams = [
+            bench_accumulator(_).max_gpu_ram_until(
+                find_event(_.events, 'first_output').monotonic
+            )
+            for _ in benches
+        ]
+        return TaskSamples(
+            gpu_rams=gpu_rams,
+            init_times=None,
+            rpses=[_.rps for _ in outputs]
+        )
+
+    # Jiant, tfidf print all predictions after inference, output rps
+    # is stdout write speed
+    raise ValueError('no input_size == 1 benches')
 
-    stats = [
-        bench_stats(_) for _ in benches
+
+def task_stats(benches):
+    samples = task_samples(benches)
+    if samples.runs:
+        # init time uncertainty propagates to rps
+        rps_ci = bootstrap_ci(
+            [samples.init_times, samples.runs],
+            calibrated_rps
+        )
+    else:
+        rps_ci = median_ci(samples.rpses)
+
+    task = benches[0].task
+    gpu_ram = statistics.median(samples.gpu_rams)
+    stats = TaskStats(task, gpu_ram / GB, statistics.median(samples.rpses))
+    stats.rps_ci = rps_ci
+    stats.gpu_ram_ci = [_ / GB for _ in median_ci(samples.gpu_rams)]
+    if samples.init_times:
+        stats.init_time = statistics.median(samples.init_times)
+        stats.init_time_ci = median_ci(samples.init_times)
+
+    if samples.records_per_joules:
+        stats.records_per_joule = statistics.median(samples.records_per_joules)
+        stats.joules_per_record = 1 / stats.records_per_joule
+
+    if samples.init_read_bytes and all(_ is not None for _ in samples.init_read_bytes):
+        stats.init_read = statistics.median(samples.init_read_bytes) / GB
+        if samples.init_read_times and all(_ is not None for _ in samples.init_read_times):
+            stats.init_read_time = statistics.median(samples.init_read_times)
+            # only intervals with reads, bytes / init time is
+            # always init_read / init_time
+            bandwidths = [
+                size / time / GB
+                for size, time in zip(samples.init_read_bytes, samples.init_read_times)
+                if time > 0
+            ]
+            if bandwidths:
+                stats.init_read_bandwidth = statistics.median(bandwidths)
+    if samples.init_major_faults and all(_ is not None for _ in samples.init_major_faults):
+        stats.init_major_faults = statistics.median(samples.init_major_faults)
+
+    outputs = [
+        output_stats(_) for _ in benches
         if _.input_size > 1
     ]
-    rps = statistics.median(
-        _.input_size / (_.total_time - init_time)
-        for _ in stats
+    outputs = [_ for _ in outputs if _]
+    if outputs:
+        stats.first_output_time = statistics.median(_.first_output_time for _ in outputs)
+        stats.output_rps = statistics.median(_.rps for _ in outputs)
+        stats.output_latency_p50 = statistics.median(_.latency_p50 for _ in outputs)
+        stats.output_latency_p95 = statistics.median(_.latency_p95 for _ in outputs)
+        stats.output_latency_p99 = statistics.median(_.latency_p99 for _ in outputs)
+
+    benches = [_ for _ in benches if _.input_size > 1]
+    steadies = [steady_stats(_) for _ in benches]
+    steadies = [_ for _ in steadies if _]
+    rpses = [_.rps for _ in steadies if _.rps is not None]
+    if rpses:
+        stats.steady_rps = statistics.median(rpses)
+    if steadies:
+        stats.warmup_time = statistics.median(_.warmup_time for _ in steadies)
+        stats.tail_time = statistics.median(_.tail_time for _ in steadies)
+
+    rams = [bench_stats(_) for _ in benches]
+    for key in ['max_ram', 'peak_ram', 'max_cgroup_ram', 'cgroup_peak_ram']:
+        values = [getattr(_, key) for _ in rams]
+        values = [_ for _ in values if _ is not None]
+        if values:
+            setattr(stats, key, statistics.median(values) / GB)
+    return stats
+
+
+#######
+#
+#   COMPARE
+#
+######
+
+
+# metric, TaskSamples field, sign: +1 higher is better
+COMPARE_METRICS = [
+    ('rps', 'rpses', 1),
+    ('init_time', 'init_times', -1),
+    ('gpu_ram', 'gpu_rams', -1),
+]
+
+
+@dataclass
+class CompareRecord:
+    model: str
+    task: str
+    metric: str
+    baseline: float
+    candidate: float
+    delta: float
+    p_value: float
+    regression: bool
+
+    # too few repeats, p-value can not get below alpha, see
+    # mann_whitney_min_p_value
+    testable: bool = True
+
+
+def mann_whitney_u(xs, ys):
+    # Number of pairs x > y, ties count 1/2
+    return sum(
+        (x > y) + (x == y) / 2
+        for x in xs
+        for y in ys
     )
 
-    task = benches[0].task
-    return TaskStats(task, gpu_ram / GB, rps)
+
+def mann_whitney_test(xs, ys, max_splits=20000, seed=1):
+    # Two sided permutation p-value of U statistic. Exact over all
+    # splits of pooled sample when there are few, 5 vs 5 repeats ->
+    # 252 splits, otherwise random splits
+    pooled = xs + ys
+    size = len(xs)
+    center = size * len(ys) / 2
+    observed = abs(mann_whitney_u(xs, ys) - center)
+
+    indexes = range(len(pooled))
+    if math.comb(len(pooled), size) <= max_splits:
+        splits = combinations(indexes, size)
+    else:
+        random = Random(seed)
+        splits = (
+            random.sample(indexes, size)
+            for _ in range(max_splits)
+        )
+
+    count, total = 0, 0
+    for split in splits:
+        split = set(split)
+        xs_ = [pooled[_] for _ in indexes if _ in split]
+        ys_ = [pooled[_] for _ in indexes if _ not in split]
+        if abs(mann_whitney_u(xs_, ys_) - center) >= observed:
+            count += 1
+        total += 1
+    return count / total
+
+
+def mann_whitney_min_p_value(xs, ys):
+    # Most extreme split, all xs above all ys or below. 3 vs 3
+    # repeats -> 2 / 20 = 0.1, never below alpha=0.05, 4 vs 4 -> 0.029
+    return 2 / math.comb(len(xs) + len(ys), len(xs))
+
+
+def compare_samples(baseline, candidate, sign, threshold, alpha):
+    baseline_median = statistics.median(baseline)
+    candidate_median = statistics.median(candidate)
+    delta = (candidate_median - baseline_median) / baseline_median
+    p_value = mann_whitney_test(baseline, candidate)
+    testable = mann_whitney_min_p_value(baseline, candidate) < alpha
+    regression = (
+        p_value < alpha
+        and sign * delta < -threshold
+    )
+    return (
+        baseline_median, candidate_median, delta, p_value,
+        regression, testable
+    )
+
+
+def compare_task_samples(baseline, candidate, thresholds, alpha):
+    for metric, field, sign in COMPARE_METRICS:
+        samples = (
+            getattr(baseline, field),
+            getattr(candidate, field)
+        )
+        if not all(samples):
+            continue
+        # CPU only, bench-cmd runs have gpu_ram 0, no relative delta
+        if statistics.median(samples[0]) == 0:
+            continue
+        yield metric, compare_samples(
+            *samples, sign,
+            thresholds[metric], alpha
+        )
+
+
+def list_bench_models_tasks(dir):
+    # <dir>/<model>/<task>, same layout as bench-matrix
+    for model in sorted(listdir(dir)):
+        if not isdir(join(dir, model)):
+            # manifest.jsonl
+            continue
+        for task in sorted(listdir(join(dir, model))):
+            if task in TASKS:
+                yield model, task
+
+
+def compare_benches(
+        baseline_dir, candidate_dir,
+        input_size=2000, batch_size=32,
+        thresholds={'rps': 0.05, 'init_time': 0.1, 'gpu_ram': 0.05},
+        alpha=0.05
+):
+    pairs = set(list_bench_models_tasks(baseline_dir))
+    for model, task in list_bench_models_tasks(candidate_dir):
+        if (model, task) not in pairs:
+            log(f'Skip {model}/{task}, no baseline')
+            continue
+
+        samples = []
+        for dir in [baseline_dir, candidate_dir]:
+            benches = list(scan_bench_group(dir, model, task, input_size, batch_size))
+            try:
+                samples.append(task_samples(benches))
+            except ValueError as error:
+                log(f'Skip {dir}/{model}/{task}: {error}')
+                break
+        else:
+            for metric, values in compare_task_samples(*samples, thresholds, alpha):
+                yield CompareRecord(model, task, metric, *values)
+
+
+def format_compare_table(records):
+    # model                  task     metric     baseline candidate  delta p_value
+    # rubert                 parus    rps           604.9     580.1  -4.1%   0.008 REGRESSION
+    # rubert                 parus    gpu_ram        2.37      2.37  +0.0%   1.000
+
+    yield (
+        f'{"model":22} {"task":8} {"metric":9} '
+        f'{"baseline":>9} {"candidate":>9} {"delta":>6} {"p_value":>7}'
+    )
+    for record in records:
+        baseline, candidate = record.baseline, record.candidate
+        if record.metric == 'gpu_ram':
+            baseline, candidate = baseline / GB, candidate / GB
+        line = (
+            f'{record.model:22} {record.task:8} {record.metric:9} '
+            f'{baseline:9.2f} {candidate:9.2f} '
+            f'{record.delta:+6.1%} {record.p_value:7.3f}'
+        )
+        if record.regression:
+            line += ' REGRESSION'
+        elif not record.testable:
+            line += ' UNTESTABLE'
+        yield line
+
+
+#######
+#
+#   AUTOTUNE
+#
+#####
+
+
+@dataclass
+class AutotunePoint:
+    batch_size: int
+    status: str
+    rps: float = None
+    max_gpu_ram: int = None
+
+
+@dataclass
+class AutotuneResult:
+    task: str
+    batch_size: int
+    rps: float
+    init_time: float
+    curve: [AutotunePoint]
+
+
+def split_bench_items(items):
+    records, events = [], []
+    for item in items:
+        if isinstance(item, BenchEvent):
+            events.append(item)
+        else:
+            records.append(item)
+    return records, events
+
+
+def run_bench(path, task, input_size, batch_size, items, dir=None):
+    # Keep log for inspection, same layout as manual bench
+    items = list(items)
+    if dir:
+        maybe_mkdir(dirname(path))
+        dump_jsonl_atomic((asdict(_) for _ in items), path)
+
+    records, events = split_bench_items(items)
+    return Bench(
+        path, task, input_size, batch_size,
+        records, events
+    )
+
+
+def sweep_bench_path(dir, input_size, batch_size, index=1, prefix=None):
+    # <dir>/<input_size>_<batch_size>_<index>.jsonl, same as
+    # bench-matrix. Prefixed names are not N_B_I.jsonl, plot|stats
+    # ignore sweep logs
+    name = f'{input_size}_{batch_size}_{index:02d}.jsonl'
+    if prefix:
+        name = f'{prefix}_{name}'
+    return join(dir, name)
+
+
+def sweep_bench(path, image, data_dir, task, input_size, batch_size, dir=None, **kwargs):
+    # One bench of Autotune, LengthSweep, ScaleBench, CpuSweep.
+    # kwargs go to bench_docker
+    items = bench_docker(
+        image, data_dir, task,
+        input_size=input_size,
+        batch_size=batch_size,
+        **kwargs
+    )
+    return run_bench(path, task, input_size, batch_size, items, dir)
+
+
+def calibration_benches(bench, repeats, label):
+    # 1_1 runs, task_stats takes init time from them. bench(index)
+    # runs one repeat
+    results = []
+    for index in range(1, repeats + 1):
+        log(f'{label}, init {index}')
+        results.append(bench(index))
+    return results
+
+
+def calibrated_task_stats(init_benches, bench):
+    # None if run failed, non zero exit code, usually CUDA OOM
+    if bench_exit_code(bench.events):
+        return
+    return task_stats(init_benches + [bench])
+
+
+class Autotune:
+    # Search batch size with max rps. Double batch size while run
+    # succeeds and fits max_gpu_ram, then bisect between largest good
+    # and smallest failed batch size down to resolution. Failed is non zero exit code,
+    # usually CUDA OOM. rps is task_stats rps: input_size / (total
+    # time - median init time of 1_1 runs)
+
+    def __init__(
+            self, image, data_dir, task,
+            input_size=2000,
+            init_repeats=3,
+            max_gpu_ram=None,
+            max_batch_size=1024,
+            resolution=8,
+            dir=None,
+            period=0.3
+    ):
+        self.image = image
+        self.data_dir = data_dir
+        self.task = task
+        self.input_size = input_size
+        self.init_repeats = init_repeats
+        self.max_gpu_ram = max_gpu_ram
+        self.max_batch_size = max_batch_size
+        self.resolution = resolution
+        self.dir = dir
+        self.period = period
+
+        self.init_benches = []
+        self.curve = {}
+
+    def bench(self, input_size, batch_size, index=1):
+        path = sweep_bench_path(join(self.dir or '', self.task), input_size, batch_size, index)
+        return sweep_bench(
+            path, self.image, self.data_dir, self.task,
+            input_size, batch_size,
+            dir=self.dir,
+            period=self.period
+        )
+
+    def init(self):
+        self.init_benches = calibration_benches(
+            partial(self.bench, 1, 1),
+            self.init_repeats, f'Bench {self.image!r}'
+        )
+
+    def probe(self, batch_size):
+        if batch_size in self.curve:
+            return self.curve[batch_size]
+
+        log(f'Bench {self.image!r}, batch_size={batch_size}')
+        bench = self.bench(self.input_size, batch_size)
+        stats = calibrated_task_stats(self.init_benches, bench)
+        if not stats:
+            point = AutotunePoint(batch_size, 'failed')
+        else:
+            max_gpu_ram = bench_stats(bench).max_gpu_ram
+            point = AutotunePoint(
+                batch_size, 'done',
+                rps=stats.rps,
+                max_gpu_ram=max_gpu_ram
+            )
+            if self.max_gpu_ram and max_gpu_ram > self.max_gpu_ram:
+                point.status = 'over_gpu_ram'
+
+        log(f'Batch size {batch_size}: {point.status}, rps={point.rps}')
+        self.curve[batch_size] = point
+        return point
+
+    def run(self):
+        self.init()
+
+        # 1, 2, 4, 8, ... until fail
+        good, bad = None, None
+        batch_size = 1
+        while batch_size <= self.max_batch_size:
+            point = self.probe(batch_size)
+            if point.status != 'done':
+                bad = batch_size
+                break
+            good = batch_size
+            batch_size *= 2
+
+        # 32 ok, 64 fail -> 48 -> 40 or 56, stop at resolution 8
+        while good and bad and bad - good > self.resolution:
+            batch_size = (good + bad) // 2
+            point = self.probe(batch_size)
+            if point.status == 'done':
+                good = batch_size
+            else:
+                bad = batch_size
+
+        curve = sorted(self.curve.values(), key=lambda _: _.batch_size)
+        points = [_ for _ in curve if _.status == 'done']
+        if not points:
+            raise RuntimeError(f'all batch sizes failed, image {self.image!r}')
+
+        best = max(points, key=lambda _: _.rps)
+        init_time = statistics.median(
+            bench_stats(_).total_time
+            for _ in self.init_benches
+        )
+        return AutotuneResult(
+            self.task, best.batch_size, best.rps,
+            init_time, curve
+        )
+
+
+#######
+#
+#   LOAD
+#
+#####
+
+
+def load_bench_path(dir, task, rate, batch_size):
+    # Not N_B_I.jsonl, plot|stats|registry ignore load logs
+    return join(dir or '', task, f'load_{rate:g}_{batch_size}.jsonl')
+
+
+def load_sweep(
+        image, data_dir, task, rates,
+        duration=30,
+        process='constant',
+        batch_size=1,
+        dir=None,
+        period=0.3,
+        marker_timeout=600
+):
+    # One warm container per rate, feed duration seconds of open loop
+    # arrivals after init, see feed_lines
+    for rate in rates:
+        size = max(math.ceil(rate * duration), 3)
+        path = load_bench_path(dir, task, rate, batch_size)
+        log(f'Load {image!r}, rate={rate}, input_size={size}')
+        items = bench_docker(
+            image, data_dir, task,
+            input_size=size,
+            batch_size=batch_size,
+            period=period,
+            warm=True,
+            marker_timeout=marker_timeout,
+            arrivals=arrival_offsets(rate, size, process)
+        )
+        bench = run_bench(path, task, size, batch_size, items, dir)
+        if find_event(bench.events, 'marker_timeout'):
+            # Model does not stream, every rate would wait
+            # marker_timeout again
+            log(f'Marker timeout, rate={rate}, stop sweep')
+            return
+        if find_event(bench.events, 'marker_exit'):
+            code = find_event(bench.events, 'exit').value
+            log(f'Container exited before marker prediction, code={code}, stop sweep')
+            return
+
+        stats = load_stats(bench, rate)
+        if not stats:
+            log(f'No latencies, rate={rate}')
+            continue
+        yield stats
+
+
+def saturation_rate(stats):
+    # Highest rate model keeps up with, all lower rates too
+    rate = None
+    for record in sorted(stats, key=lambda _: _.rate):
+        if record.saturated:
+            break
+        rate = record.rate
+    return rate
+
+
+#######
+#
+#   SYNTH
+#
+######
+
+
+SYNTH_WORDS = [
+    'мужчина', 'женщина', 'город', 'дом', 'вода', 'окно', 'книга',
+    'открыл', 'закрыл', 'увидел', 'сказал', 'пошёл', 'взял', 'нашёл',
+    'старый', 'новый', 'большой', 'красный', 'тихий', 'быстро',
+    'в', 'на', 'и', 'но', 'потому', 'что', 'когда', 'после',
+]
+
+FIXED = 'fixed'
+UNIFORM = 'uniform'
+VAL_LENGTHS = 'val'
+LENGTH_DISTRIBUTIONS = [FIXED, UNIFORM, VAL_LENGTHS]
+
+# words in short fields: hypothesis, choice, question, answer
+SYNTH_SHORT = 8
+
+
+def word_count(text):
+    return len(text.split())
+
+
+def item_length(task, item):
+    # Length of the main text field in words, the one that grows:
+    # passage, premise, text
+    if task in (MUSERC, RUCOS):
+        text = item['passage']['text']
+    elif task == DANETQA:
+        text = item['passage']
+    elif task in (LIDIRUS, RUSSE):
+        text = item['sentence1']
+    elif task == RWSD:
+        text = item['text']
+    else:
+        text = item['premise']
+    return word_count(text)
+
+
+def synth_words(random, size):
+    return [random.choice(SYNTH_WORDS) for _ in range(size)]
+
+
+def synth_text(random, size):
+    words = synth_words(random, max(size, 1))
+    return ' '.join(words).capitalize() + '.'
+
+
+def synth_span(text, start, stop):
+    # word span -> char offsets
+    words = text.split()
+    offset = len(' '.join(words[:start])) + (start > 0)
+    span = ' '.join(words[start:stop])
+    return offset, offset + len(span), span
+
+
+def synth_item(task, idx, length, random):
+    # Same schema as val.jsonl of the task, see tfidf/main.py *_encode
+    text = synth_text(random, length)
+    short = synth_text(random, SYNTH_SHORT)
+
+    if task == PARUS:
+        return {
+            'premise': text,
+            'choice1': short,
+            'choice2': synth_text(random, SYNTH_SHORT),
+            'question': random.choice(['cause', 'effect']),
+            'label': random.randint(0, 1),
+            'idx': idx
+        }
+
+    elif task in (TERRA, RCB):
+        labels = (
+            ['entailment', 'not_entailment']
+            if task == TERRA
+            else ['entailment', 'contradiction', 'neutral']
+        )
+        return {
+            'premise': text,
+            'hypothesis': short,
+            'label': random.choice(labels),
+            'idx': idx
+        }
+
+    elif task == LIDIRUS:
+        return {
+            'sentence1': text,
+            'sentence2': short,
+            'label': random.choice(['entailment', 'not_entailment']),
+            'idx': idx
+        }
+
+    elif task == DANETQA:
+        return {
+            'question': short[:-1] + '?',
+            'passage': text,
+            'label': random.choice([True, False]),
+            'idx': idx
+        }
+
+    elif task == RUSSE:
+        # target word is the first word of both sentences
+        word = random.choice(SYNTH_WORDS)
+        sentence1 = f'{word} {text}'
+        sentence2 = f'{word} {short}'
+        return {
+            'word': word,
+            'sentence1': sentence1,
+            'sentence2': sentence2,
+            'start1': 0,
+            'end1': len(word),
+            'start2': 0,
+            'end2': len(word),
+            'label': random.choice([True, False]),
+            'idx': idx
+        }
+
+    elif task == RWSD:
+        size = word_count(text)
+        span1_index = random.randrange(size)
+        span2_index = random.randrange(size)
+        return {
+            'text': text,
+            'target': {
+                'span1_index': span1_index,
+                'span1_text': text.split()[span1_index],
+                'span2_index': span2_index,
+                'span2_text': text.split()[span2_index],
+            },
+            'label': random.choice([True, False]),
+            'idx': idx
+        }
+
+    elif task == MUSERC:
+        questions, answer_idx = [], 0
+        for question_idx in range(2):
+            answers = []
+            for _ in range(3):
+                answers.append({
+                    'idx': answer_idx,
+                    'text': synth_text(random, SYNTH_SHORT),
+                    'label': random.randint(0, 1)
+                })
+                answer_idx += 1
+            questions.append({
+                'question': synth_text(random, SYNTH_SHORT)[:-1] + '?',
+                'answers': answers,
+                'idx': question_idx
+            })
+        return {
+            'idx': idx,
+            'passage': {
+                'text': text,
+                'questions': questions
+            }
+        }
+
+    elif task == RUCOS:
+        # every 10th word is an entity, query answer is one of them
+        size = word_count(text)
+        entities = [
+            synth_span(text, index, index + 1)
+            for index in range(0, size, 10)
+        ]
+        start, end, span = random.choice(entities)
+        return {
+            'idx': idx,
+            'passage': {
+                'text': text,
+                'entities': [
+                    {'start': start_, 'end': end_}
+                    for start_, end_, _ in entities
+                ]
+            },
+            'qas': [{
+                'query': short[:-1] + ' @placeholder.',
+                'answers': [{'start': start, 'end': end, 'text': span}],
+                'idx': idx
+            }]
+        }
+
+    raise ValueError(f'unknown task {task!r}')
+
+
+def synth_lengths(
+        size, random,
+        distribution=FIXED,
+        length=128, min_length=8, max_length=512,
+        val_lengths=None
+):
+    for _ in range(size):
+        if distribution == FIXED:
+            yield length
+        elif distribution == UNIFORM:
+            yield random.randint(min_length, max_length)
+        elif distribution == VAL_LENGTHS:
+            # sample from val histogram
+            yield random.choice(val_lengths)
+        else:
+            raise ValueError(f'unknown distribution {distribution!r}')
+
+
+def val_lengths(data_dir, task):
+    path = task_path(data_dir, task, VAL)
+    return [
+        item_length(task, _)
+        for _ in load_jsonl(path)
+    ]
+
+
+def synth_items(task, lengths, seed=1):
+    random = Random(seed)
+    for idx, length in enumerate(lengths):
+        yield synth_item(task, idx, length, random)
+
+
+@dataclass
+class LengthPoint:
+    length: int
+    status: str
+    rps: float = None
+    max_gpu_ram: int = None
+
+
+class LengthSweep:
+    # rps and GPU RAM as a function of record length. Same as
+    # Autotune: 1_1 runs on val records give init time, then every
+    # length is benched on input_size synthetic records of that length
+
+    def __init__(
+            self, image, data_dir, task,
+            input_size=500,
+            batch_size=32,
+            init_repeats=3,
+            dir=None,
+            period=0.3
+    ):
+        self.image = image
+        self.data_dir = data_dir
+        self.task = task
+        self.input_size = input_size
+        self.batch_size = batch_size
+        self.init_repeats = init_repeats
+        self.dir = dir
+        self.period = period
+
+        self.init_benches = []
+
+    def bench(self, input_size, batch_size, index=1, prefix=None, lines=None):
+        path = sweep_bench_path(join(self.dir or '', self.task), input_size, batch_size, index, prefix)
+        return sweep_bench(
+            path, self.image, self.data_dir, self.task,
+            input_size, batch_size,
+            dir=self.dir,
+            period=self.period,
+            lines=lines
+        )
+
+    def init(self):
+        self.init_benches = calibration_benches(
+            partial(self.bench, 1, 1),
+            self.init_repeats, f'Bench {self.image!r}'
+        )
+
+    def probe(self, length):
+        log(f'Bench {self.image!r}, length={length}')
+        lengths = [length] * self.input_size
+        items = synth_items(self.task, lengths)
+        lines = format_jsonl(items)
+        bench = self.bench(
+            self.input_size, self.batch_size,
+            prefix=f'length_{length}',
+            lines=lines
+        )
+
+        stats = calibrated_task_stats(self.init_benches, bench)
+        if not stats:
+            return LengthPoint(length, 'failed')
+
+        return LengthPoint(
+            length, 'done',
+            rps=stats.rps,
+            max_gpu_ram=bench_stats(bench).max_gpu_ram
+        )
+
+    def run(self, lengths):
+        self.init()
+        for length in lengths:
+            yield self.probe(length)
+
+
+#######
+#
+#   SCALE
+#
+######
+
+
+@dataclass
+class ReplicaStats:
+    index: int
+    image: str
+    status: str
+    rps: float = None
+    max_gpu_ram: int = None
+
+    # solo rps / rps, 1.5 -> replica is 1.5 times slower than alone
+    slowdown: float = None
+
+
+@dataclass
+class ScalePoint:
+    replicas: int
+    status: str
+    rps: float = None
+    max_gpu_ram: int = None
+    mean_slowdown: float = None
+    gain: float = None
+    stats: [ReplicaStats] = None
+
+
+def combined_max_gpu_ram(benches):
+    # Replicas are probed by different threads at different times,
+    # every value holds until next record of the same replica. Sum
+    # current values at every record, peak of sums, not sum of peaks
+    items = []
+    for index, bench in enumerate(benches):
+        for record in bench.records:
+            items.append((record_time(record), index, record.gpu_ram or 0))
+    items.sort()
+
+    current = [0] * len(benches)
+    peak = 0
+    for _, index, gpu_ram in items:
+        current[index] = gpu_ram
+        peak = max(peak, sum(current))
+    return peak
+
+
+class ScaleBench:
+    # Start N containers at once on one host, same image or a mix of
+    # images round robin, every container is probed by its own
+    # bench_docker. Replica rps is input_size / (total time - init
+    # time). Replicas load models at the same time, compete for disk
+    # and PCIe, so init time is calibrated at the same replica count:
+    # rounds of N parallel 1_1 runs. Solo rps of every image comes
+    # from 1_1 and input_size runs of that image alone
+
+    def __init__(
+            self, images, data_dir, task,
+            input_size=2000,
+            batch_size=32,
+            init_repeats=3,
+            gpus='all',
+            dir=None,
+            period=0.3
+    ):
+        self.images = images
+        self.data_dir = data_dir
+        self.task = task
+        self.input_size = input_size
+        self.batch_size = batch_size
+        self.init_repeats = init_repeats
+        self.gpus = gpus
+        self.dir = dir
+        self.period = period
+
+        # (image, replicas) -> 1_1 benches
+        self.init_benches = {}
+        self.solo_rps = {}
+
+    def bench(self, image, input_size, batch_size, index=1, prefix=None):
+        # <dir>/<task>/<image>/, no slash in dir name
+        dir = join(self.dir or '', self.task, image.replace('/', '_'))
+        path = sweep_bench_path(dir, input_size, batch_size, index, prefix)
+        return sweep_bench(
+            path, image, self.data_dir, self.task,
+            input_size, batch_size,
+            dir=self.dir,
+            period=self.period,
+            gpus=self.gpus
+        )
+
+    def solo(self, image):
+        self.init_benches[image, 1] = calibration_benches(
+            partial(self.bench, image, 1, 1),
+            self.init_repeats, f'Bench {image!r}'
+        )
+
+        log(f'Bench {image!r}, solo')
+        bench = self.bench(image, self.input_size, self.batch_size, prefix='solo')
+        stats = calibrated_task_stats(self.init_benches[image, 1], bench)
+        if not stats:
+            raise RuntimeError(f'solo bench failed, image {image!r}')
+        self.solo_rps[image] = stats.rps
+
+    def replica_image(self, index):
+        return self.images[index % len(self.images)]
+
+    def replica(self, replicas, input_size, batch_size, repeat, index):
+        image = self.replica_image(index)
+        bench = self.bench(
+            image, input_size, batch_size, repeat,
+            prefix=f'scale_{replicas}_{index:02d}'
+        )
+        return image, bench
+
+    def parallel(self, replicas, input_size, batch_size, repeat=1):
+        with ThreadPoolExecutor(replicas) as pool:
+            return list(pool.map(
+                partial(self.replica, replicas, input_size, batch_size, repeat),
+                range(replicas)
+            ))
+
+    def init(self, replicas):
+        images = {self.replica_image(_) for _ in range(replicas)}
+        if all((_, replicas) in self.init_benches for _ in images):
+            # 1 replica, solo 1_1 runs
+            return
+
+        rounds = calibration_benches(
+            partial(self.parallel, replicas, 1, 1),
+            self.init_repeats, f'Bench {replicas} replicas'
+        )
+        for results in rounds:
+            for image, bench in results:
+                self.init_benches.setdefault((image, replicas), []).append(bench)
+
+    def point(self, replicas):
+        self.init(replicas)
+        log(f'Bench {replicas} replicas')
+        results = self.parallel(replicas, self.input_size, self.batch_size)
+
+        stats = []
+        for index, (image, bench) in enumerate(results):
+            task = calibrated_task_stats(self.init_benches[image, replicas], bench)
+            if not task:
+                stats.append(ReplicaStats(index, image, 'failed'))
+                continue
+            rps = task.rps
+            stats.append(ReplicaStats(
+                index, image, 'done',
+                rps=rps,
+                max_gpu_ram=bench_stats(bench).max_gpu_ram,
+                slowdown=self.solo_rps[image] / rps
+            ))
+
+        point = ScalePoint(replicas, 'done', stats=stats)
+        if any(_.status != 'done' for _ in stats):
+            point.status = 'failed'
+            return point
+
+        # replicas run in parallel, aggregate throughput is sum
+        point.rps = sum(_.rps for _ in stats)
+        point.max_gpu_ram = combined_max_gpu_ram([bench for _, bench in results])
+        point.mean_slowdown = statistics.mean(_.slowdown for _ in stats)
+        return point
+
+    def run(self, counts):
+        for image in sorted(set(self.images)):
+            self.solo(image)
+
+        previous = None
+        for replicas in sorted(counts):
+            point = self.point(replicas)
+            if point.status == 'done' and previous:
+                # 2 -> 4 replicas, 300 -> 360 rps, gain 0.2
+                point.gain = point.rps / previous.rps - 1
+            log(
+                f'Replicas {replicas}: {point.status}, rps={point.rps}, '
+                f'gain={point.gain}'
+            )
+            yield point
+            if point.status != 'done':
+                break
+            previous = point
+
+
+def diminishing_replicas(points, min_gain=0.1):
+    # Largest replica count that still adds min_gain throughput over
+    # previous count
+    replicas = None
+    for point in points:
+        if point.status != 'done':
+            break
+        if point.gain is not None and point.gain < min_gain:
+            break
+        replicas = point.replicas
+    return replicas
+
+
+#######
+#
+#   CPU SWEEP
+#
+######
+
+
+@dataclass
+class ThreadPoint:
+    threads: int
+    cpuset: str
+    status: str
+    rps: float = None
+    init_time: float = None
+    max_ram: int = None
+    mean_cpu_usage: float = None
+
+
+def thread_cpuset(threads):
+    # 4 -> 0-3, first cores
+    return f'0-{threads - 1}'
+
+
+class CpuSweep:
+    # CPU only inference, no --gpus. Same as Autotune: 1_1 runs give
+    # init time, then input_size run, for every thread count. Import
+    # and model load on 1 pinned core is slower than on all cores, so
+    # 1_1 runs use the same threads and cpuset as input_size run. With
+    # pin container is limited to first "threads" cores, otherwise
+    # only thread pools are limited and scheduler spreads threads over
+    # all cores
+
+    def __init__(
+            self, image, data_dir, task,
+            input_size=200,
+            batch_size=32,
+            init_repeats=3,
+            pin=False,
+            dir=None,
+            period=0.3
+    ):
+        self.image = image
+        self.data_dir = data_dir
+        self.task = task
+        self.input_size = input_size
+        self.batch_size = batch_size
+        self.init_repeats = init_repeats
+        self.pin = pin
+        self.dir = dir
+        self.period = period
+
+    def bench(self, threads, input_size, batch_size, index=1):
+        path = sweep_bench_path(
+            join(self.dir or '', self.task),
+            input_size, batch_size, index,
+            prefix=f'threads_{threads}'
+        )
+        return sweep_bench(
+            path, self.image, self.data_dir, self.task,
+            input_size, batch_size,
+            dir=self.dir,
+            period=self.period,
+            gpus=None,
+            threads=threads,
+            cpuset=self.cpuset(threads)
+        )
+
+    def cpuset(self, threads):
+        if self.pin:
+            return thread_cpuset(threads)
+
+    def probe(self, threads):
+        label = f'Bench {self.image!r}, threads={threads}'
+        init_benches = calibration_benches(
+            partial(self.bench, threads, 1, 1),
+            self.init_repeats, label
+        )
+
+        log(label)
+        bench = self.bench(threads, self.input_size, self.batch_size)
+        task = calibrated_task_stats(init_benches, bench)
+        if not task:
+            return ThreadPoint(threads, self.cpuset(threads), 'failed')
+
+        stats = bench_stats(bench)
+        return ThreadPoint(
+            threads, self.cpuset(threads), 'done',
+            rps=task.rps,
+            init_time=task.init_time,
+            max_ram=stats.max_tree_ram or stats.max_ram,
+            mean_cpu_usage=stats.mean_cpu_usage
+        )
+
+    def run(self, threads):
+        for count in threads:
+            yield self.probe(count)
 
 
 #######
@@ -679,10 +4085,233 @@ def cli_bench(args):
     records = bench_docker(
         args.image, args.data_dir, args.task,
         input_size=args.input_size,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        period=args.period,
+        cgroup=args.cgroup,
+        warm=args.warm,
+        marker_timeout=args.marker_timeout,
+        gpus=None if args.cpu else 'all',
+        threads=args.threads,
+        cpuset=args.cpuset,
+        probes=args.probes
     )
+    accumulator = BenchStatsAccumulator()
+    records = accumulate(records, accumulator)
     items = (asdict(_) for _ in records)
     print_jsonl(items)
+    log_bench_stats(accumulator)
+
+
+def cli_bench_cmd(args):
+    command = args.command
+    if command[:1] == ['--']:
+        command = command[1:]
+    if not command:
+        raise ValueError('empty command')
+
+    log(f'Bench {command!r}, input_size={args.input_size}')
+    records = bench_cmd(
+        command, args.data_dir, args.task,
+        input_size=args.input_size,
+        period=args.period,
+        cgroup=args.cgroup,
+        warm=args.warm,
+        marker_timeout=args.marker_timeout,
+        gpu=not args.cpu,
+        threads=args.threads,
+        cpuset=args.cpuset,
+        probes=args.probes
+    )
+    accumulator = BenchStatsAccumulator()
+    records = accumulate(records, accumulator)
+    items = (asdict(_) for _ in records)
+    print_jsonl(items)
+    log_bench_stats(accumulator)
+
+
+def cli_bench_matrix(args):
+    cells = list(bench_matrix_cells(
+        args.models, args.tasks,
+        args.input_sizes, args.batch_sizes,
+        args.repeats
+    ))
+    log(f'Bench matrix {len(cells)} cells -> {args.dir!r}')
+    matrix = BenchMatrix(
+        args.data_dir, args.dir,
+        image_pattern=args.image_pattern,
+        devices=args.devices,
+        per_device=args.per_device,
+        period=args.period,
+        cgroup=args.cgroup
+    )
+    failed = 0
+    for path, status in matrix.run(cells):
+        if status != 'done':
+            failed += 1
+
+    if args.target_ci_width:
+        groups = list(bench_matrix_groups(
+            args.models, args.tasks,
+            args.input_sizes, args.batch_sizes
+        ))
+        runs = matrix.run_adaptive(
+            groups, args.repeats,
+            args.target_ci_width, args.max_repeats
+        )
+        for path, status in runs:
+            if status != 'done':
+                failed += 1
+
+    log(f'Failed {failed} cells')
+
+
+def cli_autotune(args):
+    max_gpu_ram = None
+    if args.max_gpu_ram:
+        max_gpu_ram = args.max_gpu_ram * GB
+
+    log(f'Autotune {args.image!r}, input_size={args.input_size}')
+    autotune = Autotune(
+        args.image, args.data_dir, args.task,
+        input_size=args.input_size,
+        init_repeats=args.init_repeats,
+        max_gpu_ram=max_gpu_ram,
+        max_batch_size=args.max_batch_size,
+        resolution=args.resolution,
+        dir=args.dir,
+        period=args.period
+    )
+    result = autotune.run()
+    log(f'Optimal batch size {result.batch_size}, rps={result.rps:.1f}')
+    item = asdict(result)
+    print(format_json(item))
+
+
+def cli_compare(args):
+    log(f'Compare {args.candidate_dir!r} to {args.baseline_dir!r}')
+    thresholds = {
+        'rps': args.rps_threshold,
+        'init_time': args.init_time_threshold,
+        'gpu_ram': args.gpu_ram_threshold,
+    }
+    records = list(compare_benches(
+        args.baseline_dir, args.candidate_dir,
+        input_size=args.input_size,
+        batch_size=args.batch_size,
+        thresholds=thresholds,
+        alpha=args.alpha
+    ))
+    if not records:
+        log('No model/task pairs compared')
+        sys.exit(2)
+
+    for line in format_compare_table(records):
+        print(line)
+
+    untestable = sum(not _.testable for _ in records)
+    if untestable:
+        size = 2
+        while mann_whitney_min_p_value([0] * size, [0] * size) >= args.alpha:
+            size += 1
+        log(
+            f'{untestable} metrics untestable, too few repeats for '
+            f'alpha={args.alpha}, use at least {size} per side'
+        )
+
+    regressions = sum(_.regression for _ in records)
+    if regressions:
+        log(f'Found {regressions} regressions')
+        sys.exit(1)
+
+
+def cli_load(args):
+    log(f'Load sweep {args.image!r}, rates={args.rates!r}, arrival={args.arrival}')
+    stats = []
+    records = load_sweep(
+        args.image, args.data_dir, args.task, args.rates,
+        duration=args.duration,
+        process=args.arrival,
+        batch_size=args.batch_size,
+        dir=args.dir,
+        period=args.period,
+        marker_timeout=args.marker_timeout
+    )
+    for record in records:
+        print(format_json(asdict(record)), flush=True)
+        stats.append(record)
+
+    log(f'Saturation rate {saturation_rate(stats)}')
+
+
+def cli_synth(args):
+    random = Random(args.seed)
+    lengths = None
+    if args.distribution == VAL_LENGTHS:
+        lengths = val_lengths(args.data_dir, args.task)
+    lengths = synth_lengths(
+        args.size, random,
+        distribution=args.distribution,
+        length=args.length,
+        min_length=args.min_length,
+        max_length=args.max_length,
+        val_lengths=lengths
+    )
+    path = task_path(args.dir, args.task, VAL)
+    log(f'Synth {args.size} {args.task!r} records -> {path!r}')
+    items = synth_items(args.task, lengths, args.seed)
+    maybe_mkdir(dirname(path))
+    dump_jsonl(items, path)
+
+
+def cli_length_sweep(args):
+    log(f'Length sweep {args.image!r}, lengths={args.lengths!r}')
+    sweep = LengthSweep(
+        args.image, args.data_dir, args.task,
+        input_size=args.input_size,
+        batch_size=args.batch_size,
+        init_repeats=args.init_repeats,
+        dir=args.dir,
+        period=args.period
+    )
+    for point in sweep.run(args.lengths):
+        log(f'Length {point.length}: {point.status}, rps={point.rps}')
+        print(format_json(asdict(point)), flush=True)
+
+
+def cli_scale(args):
+    log(f'Scale {args.images!r}, replicas={args.replicas!r}')
+    bench = ScaleBench(
+        args.images, args.data_dir, args.task,
+        input_size=args.input_size,
+        batch_size=args.batch_size,
+        init_repeats=args.init_repeats,
+        gpus=args.gpus,
+        dir=args.dir,
+        period=args.period
+    )
+    points = []
+    for point in bench.run(args.replicas):
+        print(format_json(asdict(point)), flush=True)
+        points.append(point)
+
+    replicas = diminishing_replicas(points, args.min_gain)
+    log(f'Diminishing returns after {replicas} replicas')
+
+
+def cli_cpu_sweep(args):
+    log(f'CPU sweep {args.image!r}, threads={args.threads!r}, pin={args.pin}')
+    sweep = CpuSweep(
+        args.image, args.data_dir, args.task,
+        input_size=args.input_size,
+        batch_size=args.batch_size,
+        init_repeats=args.init_repeats,
+        pin=args.pin,
+        dir=args.dir,
+        period=args.period
+    )
+    for point in sweep.run(args.threads):
+        log(f'Threads {point.threads}: {point.status}, rps={point.rps}')
+        print(format_json(asdict(point)), flush=True)
 
 
 def cli_plot(args):
@@ -695,10 +4324,30 @@ def cli_plot(args):
     fig.savefig(args.image_path)
 
 
+def cli_export_trace(args):
+    log(f'Export trace {args.bench_paths!r} -> {args.trace_path!r}')
+    benches = [
+        load_bench(_)
+        for _ in args.bench_paths
+    ]
+    trace = bench_trace(benches)
+    dump_text(format_json(trace), args.trace_path)
+
+
+def cli_convert(args):
+    paths = list(list_jsonl_benches(args.dir))
+    log(f'Convert {len(paths)} benches in {args.dir!r} to {NPZ}')
+    for path in paths:
+        target = convert_bench(path)
+        if args.remove:
+            remove(path)
+        log(f'{path!r} -> {target!r}')
+
+
 def cli_stats(args):
     log(f'Stats {args.bench_paths!r}')
     benches = [
-        load_bench(_)
+        scan_bench(_)
         for _ in args.bench_paths
     ]
     stats = task_stats(benches)
@@ -730,12 +4379,150 @@ def main(args):
     sub.add_argument('task', choices=TASKS)
     sub.add_argument('--input-size', type=int, default=10000)
     sub.add_argument('--batch-size', type=int, default=128)
+    sub.add_argument('--period', type=float, default=0.3)
+    sub.add_argument('--cgroup', action='store_true')
+    sub.add_argument('--warm', action='store_true')
+    sub.add_argument('--marker-timeout', type=float, default=600)
+    sub.add_argument('--cpu', action='store_true')
+    sub.add_argument('--threads', type=int)
+    sub.add_argument('--cpuset')
+    sub.add_argument('--probes', nargs='+', help='proc cgroup nvidia fake:path')
+
+    sub = subs.add_parser('bench-cmd')
+    sub.set_defaults(function=cli_bench_cmd)
+    sub.add_argument('data_dir', type=existing_path)
+    sub.add_argument('task', choices=TASKS)
+    sub.add_argument('--input-size', type=int, default=10000)
+    sub.add_argument('--period', type=float, default=0.3)
+    sub.add_argument('--cgroup', action='store_true')
+    sub.add_argument('--warm', action='store_true')
+    sub.add_argument('--marker-timeout', type=float, default=600)
+    sub.add_argument('--cpu', action='store_true')
+    sub.add_argument('--threads', type=int)
+    sub.add_argument('--cpuset')
+    sub.add_argument('--probes', nargs='+', help='proc cgroup nvidia fake:path')
+    sub.add_argument('command', nargs='+')
+
+    sub = subs.add_parser('bench-matrix')
+    sub.set_defaults(function=cli_bench_matrix)
+    sub.add_argument('data_dir', type=existing_path)
+    sub.add_argument('dir')
+    sub.add_argument('--models', nargs='+', default=MODELS)
+    sub.add_argument('--tasks', nargs='+', choices=TASKS, default=TASKS)
+    sub.add_argument('--input-sizes', nargs='+', type=int, default=[1, 2000])
+    sub.add_argument('--batch-sizes', nargs='+', type=int, default=[32])
+    sub.add_argument('--repeats', type=int, default=5)
+    sub.add_argument('--image-pattern', default='russiannlp/{model}-{task}')
+    sub.add_argument('--devices', nargs='+', default=['all'])
+    sub.add_argument('--per-device', type=int, default=1)
+    sub.add_argument('--period', type=float, default=0.3)
+    sub.add_argument('--cgroup', action='store_true')
+    sub.add_argument('--target-ci-width', type=float)
+    sub.add_argument('--max-repeats', type=int, default=15)
+
+    sub = subs.add_parser('autotune')
+    sub.set_defaults(function=cli_autotune)
+    sub.add_argument('image')
+    sub.add_argument('data_dir', type=existing_path)
+    sub.add_argument('task', choices=TASKS)
+    sub.add_argument('--input-size', type=int, default=2000)
+    sub.add_argument('--init-repeats', type=int, default=3)
+    sub.add_argument('--max-gpu-ram', type=float, help='GB')
+    sub.add_argument('--max-batch-size', type=int, default=1024)
+    sub.add_argument('--resolution', type=int, default=8)
+    sub.add_argument('--dir')
+    sub.add_argument('--period', type=float, default=0.3)
+
+    sub = subs.add_parser('load')
+    sub.set_defaults(function=cli_load)
+    sub.add_argument('image')
+    sub.add_argument('data_dir', type=existing_path)
+    sub.add_argument('task', choices=TASKS)
+    sub.add_argument('--rates', nargs='+', type=float, required=True)
+    sub.add_argument('--arrival', choices=ARRIVALS, default='constant')
+    sub.add_argument('--duration', type=float, default=30)
+    sub.add_argument('--batch-size', type=int, default=1)
+    sub.add_argument('--dir')
+    sub.add_argument('--period', type=float, default=0.3)
+    sub.add_argument('--marker-timeout', type=float, default=600)
+
+    sub = subs.add_parser('synth')
+    sub.set_defaults(function=cli_synth)
+    sub.add_argument('data_dir', type=existing_path)
+    sub.add_argument('dir')
+    sub.add_argument('task', choices=TASKS)
+    sub.add_argument('--size', type=int, default=2000)
+    sub.add_argument('--distribution', choices=LENGTH_DISTRIBUTIONS, default=FIXED)
+    sub.add_argument('--length', type=int, default=128)
+    sub.add_argument('--min-length', type=int, default=8)
+    sub.add_argument('--max-length', type=int, default=512)
+    sub.add_argument('--seed', type=int, default=1)
+
+    sub = subs.add_parser('length-sweep')
+    sub.set_defaults(function=cli_length_sweep)
+    sub.add_argument('image')
+    sub.add_argument('data_dir', type=existing_path)
+    sub.add_argument('task', choices=TASKS)
+    sub.add_argument('--lengths', nargs='+', type=int, default=[16, 64, 256, 1024])
+    sub.add_argument('--input-size', type=int, default=500)
+    sub.add_argument('--batch-size', type=int, default=32)
+    sub.add_argument('--init-repeats', type=int, default=3)
+    sub.add_argument('--dir')
+    sub.add_argument('--period', type=float, default=0.3)
+
+    sub = subs.add_parser('scale')
+    sub.set_defaults(function=cli_scale)
+    sub.add_argument('data_dir', type=existing_path)
+    sub.add_argument('task', choices=TASKS)
+    sub.add_argument('--images', nargs='+', required=True)
+    sub.add_argument('--replicas', nargs='+', type=int, default=[1, 2, 4])
+    sub.add_argument('--input-size', type=int, default=2000)
+    sub.add_argument('--batch-size', type=int, default=32)
+    sub.add_argument('--init-repeats', type=int, default=3)
+    sub.add_argument('--gpus', default='all')
+    sub.add_argument('--min-gain', type=float, default=0.1)
+    sub.add_argument('--dir')
+    sub.add_argument('--period', type=float, default=0.3)
+
+    sub = subs.add_parser('cpu-sweep')
+    sub.set_defaults(function=cli_cpu_sweep)
+    sub.add_argument('image')
+    sub.add_argument('data_dir', type=existing_path)
+    sub.add_argument('task', choices=TASKS)
+    sub.add_argument('--threads', nargs='+', type=int, default=[1, 2, 4, 8])
+    sub.add_argument('--pin', action='store_true')
+    sub.add_argument('--input-size', type=int, default=200)
+    sub.add_argument('--batch-size', type=int, default=32)
+    sub.add_argument('--init-repeats', type=int, default=3)
+    sub.add_argument('--dir')
+    sub.add_argument('--period', type=float, default=0.3)
 
     sub = subs.add_parser('plot')
     sub.set_defaults(function=cli_plot)
     sub.add_argument('bench_paths', nargs='+', type=existing_path)
     sub.add_argument('image_path')
 
+    sub = subs.add_parser('export-trace')
+    sub.set_defaults(function=cli_export_trace)
+    sub.add_argument('bench_paths', nargs='+', type=existing_path)
+    sub.add_argument('trace_path')
+
+    sub = subs.add_parser('compare')
+    sub.set_defaults(function=cli_compare)
+    sub.add_argument('baseline_dir', type=existing_path)
+    sub.add_argument('candidate_dir', type=existing_path)
+    sub.add_argument('--input-size', type=int, default=2000)
+    sub.add_argument('--batch-size', type=int, default=32)
+    sub.add_argument('--rps-threshold', type=float, default=0.05)
+    sub.add_argument('--init-time-threshold', type=float, default=0.1)
+    sub.add_argument('--gpu-ram-threshold', type=float, default=0.05)
+    sub.add_argument('--alpha', type=float, default=0.05)
+
+    sub = subs.add_parser('convert')
+    sub.set_defaults(function=cli_convert)
+    sub.add_argument('dir', type=existing_path)
+    sub.add_argument('--remove', action='store_true')
+
     sub = subs.add_parser('stats')
     sub.set_defaults(function=cli_stats)
     sub.add_argument('bench_paths', nargs='+', type=existing_path)
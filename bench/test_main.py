@@ -0,0 +1,587 @@
+import sys
+import math
+import subprocess
+from time import sleep, monotonic
+from os.path import dirname, join
+from importlib.util import (
+    spec_from_file_location,
+    module_from_spec
+)
+
+import pytest
+
+
+# top level main.py has the same module name, load by path
+spec = spec_from_file_location('bench_main', join(dirname(__file__), 'main.py'))
+main = module_from_spec(spec)
+sys.modules[spec.name] = main
+spec.loader.exec_module(main)
+
+
+#######
+#
+#   SCHEDULE
+#
+######
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_fixed_rate_ticks(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(main, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(main, 'sleep', clock.sleep)
+
+    # probe costs, 2.5 sec probe skips deadline 2
+    costs = [0.2, 2.5, 0.1, 0.3]
+    ticks = []
+    for tick, cost in zip(main.fixed_rate_ticks(period=1), costs):
+        ticks.append((tick.index, tick.missed, clock.now))
+        clock.now += cost
+    assert ticks == [
+        (0, 0, 0),
+        (1, 0, 1),
+        (3, 1, 3.5),
+        (4, 0, 4),
+    ]
+
+
+#######
+#
+#   PROC
+#
+######
+
+
+def test_parse_proc_stat():
+    # comm with spaces and parens
+    text = (
+        '2871 (python3 (x) y) R 2867 2871 2867 0 -1 4194304 84 0 7 0 '
+        '13 5 0 0 20 0 1 0 5432 0 0'
+    )
+    stat = main.parse_proc_stat(text)
+    assert stat == main.ProcStatRecord(
+        pid=2871, ppid=2867,
+        utime=13, stime=5,
+        starttime=5432, majflt=7
+    )
+
+
+def test_parse_proc_status():
+    text = 'Name:\tpython3\nVmHWM:\t    1316 kB\nVmRSS:\t     904 kB\n'
+    status = dict(main.parse_proc_status(text))
+    assert status == {
+        'Name': 'python3',
+        'VmHWM': 1316 * main.KB,
+        'VmRSS': 904 * main.KB
+    }
+
+
+def test_parse_proc_io():
+    text = 'rchar: 3980\nwchar: 0\nread_bytes: 4096\nwrite_bytes: 8192\n'
+    io = dict(main.parse_proc_io(text))
+    assert io['read_bytes'] == 4096
+    assert io['write_bytes'] == 8192
+
+
+@pytest.fixture
+def python_child():
+    # plain child, 50mb resident, busy loop
+    process = subprocess.Popen([
+        sys.executable, '-c',
+        'data = bytearray(50 * 1024 * 1024)\nwhile True: pass'
+    ])
+    deadline = monotonic() + 5
+    while main.proc_statm(process.pid).resident < 50 * main.MB:
+        assert monotonic() < deadline
+        sleep(0.05)
+    yield process
+    process.kill()
+    process.wait()
+
+
+def test_proc_ps_stats(python_child):
+    stats = main.proc_ps_stats(python_child.pid)
+    assert stats.pid == python_child.pid
+    assert stats.ram >= 50 * main.MB
+    assert stats.peak_ram >= stats.ram
+    assert 0 <= stats.cpu_usage <= 1.5
+
+
+def test_proc_probe(python_child):
+    probe = main.ProcProbe()
+    first = probe.probe(python_child.pid)
+    assert first['ram'] >= 50 * main.MB
+    assert first['tree_size'] == 1
+    assert 'cpu_usage' not in first
+
+    # busy loop, one core
+    sleep(0.3)
+    second = probe.probe(python_child.pid)
+    assert 0.5 < second['cpu_usage'] < 1.5
+    assert 0.5 < second['tree_cpu_usage'] < 1.5
+
+
+def test_proc_ps_stats_missing():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    assert main.proc_ps_stats(process.pid) is None
+    assert main.ProcProbe().probe(process.pid) == {}
+
+
+@pytest.fixture
+def forking_child():
+    # shell with 2 children
+    process = subprocess.Popen(['sh', '-c', 'sleep 10 & sleep 10 & wait'])
+    deadline = monotonic() + 5
+    while len(list(main.proc_scan_tree_stats(process.pid))) < 3:
+        assert monotonic() < deadline
+        sleep(0.05)
+    yield process
+    process.kill()
+    process.wait()
+
+
+def test_proc_tree_ps_stats(forking_child):
+    stats = main.proc_tree_ps_stats(forking_child.pid)
+    assert stats.size == 3
+    assert forking_child.pid in stats.cpu_times
+    assert stats.ram == sum(
+        main.proc_statm(_).resident
+        for _ in stats.cpu_times
+    )
+
+
+def test_proc_tree_walk_same_as_scan(forking_child, monkeypatch):
+    # children files from ppid scan, sandbox kernels may lack them
+    def proc_children(pid):
+        return [_.pid for _ in main.proc_all_stats() if _.ppid == pid]
+
+    monkeypatch.setattr(main, 'PROC_CHILDREN', True)
+    monkeypatch.setattr(main, 'proc_children', proc_children)
+    walk = {_.pid for _ in main.proc_tree_stats(forking_child.pid)}
+    scan = {_.pid for _ in main.proc_scan_tree_stats(forking_child.pid)}
+    assert walk == scan
+
+
+#######
+#
+#   NVIDIA
+#
+######
+
+
+FAKE_NVIDIA_SMI = '''#!{python}
+import sys, time
+if any('query-gpu' in _ for _ in sys.argv):
+    lines = [
+        'uuid, memory.total [MiB], utilization.gpu [%], utilization.memory [%], power.draw [W]',
+        'GPU-1, 32510 MiB, 43 %, 22 %, 71.34 W',
+        'GPU-2, [N/A], [N/A], [Not Supported], [N/A]',
+        'GPU-3, broken',
+    ]
+else:
+    lines = [
+        'pid, gpu_uuid, used_gpu_memory [MiB]',
+        '{pid}, GPU-1, 4435 MiB',
+    ]
+while True:
+    print('\\n'.join(lines), flush=True)
+    time.sleep(0.05)
+'''
+
+
+@pytest.fixture
+def fake_nvidia_smi(tmp_path, monkeypatch):
+    path = tmp_path / 'nvidia-smi'
+    path.write_text(FAKE_NVIDIA_SMI.format(python=sys.executable, pid=123))
+    path.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path), prepend=':')
+
+
+def wait_for(function, timeout=5):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        value = function()
+        if value:
+            return value
+        sleep(0.05)
+
+
+def test_nvidia_telemetry(fake_nvidia_smi):
+    with main.NvidiaTelemetry(loop_ms=50) as telemetry:
+        process = wait_for(lambda: telemetry.process_stats(123))
+        gpu = wait_for(lambda: telemetry.gpu_stats('GPU-1'))
+        # MIG, broken line do not kill reader
+        mig = wait_for(lambda: telemetry.gpu_stats('GPU-2'))
+
+    assert process.gpu_ram == 4435 * main.MB
+    assert gpu.gpu_usage == 0.43
+    assert gpu.power == 71.34
+    assert not telemetry.children
+    assert mig.gpu_usage is None
+    assert mig.total_gpu_ram is None
+    assert mig.power is None
+
+
+def test_nvidia_probe(fake_nvidia_smi):
+    # gpu and process readers are separate threads
+    def probe_both():
+        values = probe.probe(123)
+        if values and 'gpu_power' in values:
+            return values
+
+    probe = main.NvidiaProbe()
+    probe.start(123)
+    try:
+        values = wait_for(probe_both)
+    finally:
+        probe.stop()
+    assert values == dict(gpu_ram=4435 * main.MB, gpu_usage=0.43, gpu_power=71.34)
+
+
+def test_nvidia_telemetry_missing(monkeypatch, tmp_path):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    with main.NvidiaTelemetry() as telemetry:
+        assert telemetry.gpu_stats('GPU-1') is None
+
+
+#######
+#
+#   PROBES
+#
+######
+
+
+def test_probe_backends_failure(tmp_path):
+    path = tmp_path / 'probe.jsonl'
+    path.write_text(
+        '{"gpu_ram": 1000, "gpu_usage": 0.5}\n'
+        '{"raise": "nvidia-smi died"}\n'
+    )
+    backends = [main.FakeProbe(str(path))]
+    failed = set()
+
+    record = main.probe_backends(1, backends, failed)
+    assert record.gpu_ram == 1000
+    assert record.probes == ['fake']
+
+    for _ in range(2):
+        record = main.probe_backends(1, backends, failed)
+        assert record.gpu_ram is None
+        assert record.gpu_usage is None
+        assert record.probes == []
+    assert failed == {'fake'}
+
+    # bench log line as fake script, clock fields are not overridden
+    path = tmp_path / 'log.jsonl'
+    path.write_text(
+        '{"timestamp": 1626190000.1, "monotonic": 5.0, "missed_ticks": 3, '
+        '"probes": ["nvidia"], "cpu_usage": 1.5, "ram": 2000, '
+        '"gpu_usage": 0.43, "gpu_ram": 1000}\n'
+    )
+    record = main.probe_backends(1, [main.FakeProbe(str(path))], set())
+    assert record.gpu_ram == 1000
+    assert record.cpu_usage == 1.5
+    assert record.probes == ['fake']
+    assert record.monotonic != 5.0
+    assert record.missed_ticks is None
+
+
+def test_make_probe():
+    assert main.make_probe('proc').name == 'proc'
+    with pytest.raises(ValueError):
+        main.make_probe('smi')
+
+
+#######
+#
+#   BENCH
+#
+######
+
+
+def test_bench_command_warm_exit():
+    # crashed container, no wait for marker timeout
+    items = main.bench_command(
+        [sys.executable, '-c', 'import sys; sys.exit(3)'],
+        lines=['{}'],
+        period=0.05,
+        marker='{}',
+        marker_timeout=30,
+        probes=['proc']
+    )
+    begin = monotonic()
+    events = [_ for _ in items if isinstance(_, main.BenchEvent)]
+    assert monotonic() - begin < 5
+
+    names = [_.event for _ in events]
+    assert 'marker_exit' in names
+    assert 'marker_timeout' not in names
+    assert main.find_event(events, 'exit').value == 3
+
+
+def make_bench(events, records=()):
+    return main.Bench(
+        path='terra/10_1_01.jsonl', task='terra',
+        input_size=10, batch_size=1,
+        records=list(records),
+        events=[
+            main.BenchEvent(name, timestamp=0, monotonic=stamp, value=value)
+            for name, stamp, value in events
+        ]
+    )
+
+
+def test_output_stats_warm():
+    # marker prediction at 5, measured outputs every 0.1 sec
+    stamps = [5] + [6 + _ * 0.1 for _ in range(11)]
+    bench = make_bench([
+        ('start', 0, None),
+        ('init_end', 5, None),
+        ('outputs', 5, stamps),
+    ])
+    stats = main.output_stats(bench)
+    assert stats.first_output_time == pytest.approx(1)
+    assert stats.rps == pytest.approx(10)
+    assert stats.latency_p99 == pytest.approx(0.1)
+
+
+#######
+#
+#   STATS
+#
+######
+
+
+def power_bench_items(event_after_record):
+    # 100 W until 2 sec, 200 W after, init_end at 2.5. Power of a
+    # record is held over interval before it
+    records = [
+        main.BenchRecord(
+            timestamp=time, cpu_usage=1, ram=0, gpu_usage=0.9, gpu_ram=0,
+            monotonic=time, gpu_power=power
+        )
+        for time, power in [(0, 100), (1, 100), (2, 100), (3, 200), (4, 200)]
+    ]
+    init_end = main.BenchEvent('init_end', timestamp=2.5, monotonic=2.5)
+    # live log writes event after record of the same tick, npz sorts
+    index = 4 if event_after_record else 3
+    return records[:index] + [init_end] + records[index:]
+
+
+@pytest.mark.parametrize('event_after_record', [True, False])
+def test_accumulator_energy_split(event_after_record):
+    accumulator = main.BenchStatsAccumulator()
+    for item in power_bench_items(event_after_record):
+        accumulator.add(item)
+    assert accumulator.energy == pytest.approx(600)
+    assert accumulator.init_energy == pytest.approx(300)
+
+
+def test_bootstrap_ci():
+    values = [10, 11, 12, 13, 14]
+    lower, upper = main.median_ci(values)
+    assert 10 <= lower <= 12 <= upper <= 14
+    # fixed seed, reproducible
+    assert main.median_ci(values) == [lower, upper]
+    assert main.median_ci([5, 5, 5]) == [5, 5]
+
+
+def test_bootstrap_ci_unbounded():
+    # slow init resamples eat all processing time, upper is inf
+    lower, upper = main.bootstrap_ci(
+        [[1, 12, 12], [(1000, 10), (1000, 10), (1000, 10)]],
+        main.calibrated_rps
+    )
+    assert lower is not None
+    assert upper is None
+
+
+def test_calibrated_rps():
+    runs = [(1000, 12), (1000, 12.5), (1000, 11.5)]
+    assert main.calibrated_rps([10, 10, 10], runs) == pytest.approx(500)
+    assert main.calibrated_rps([10, 11, 9], runs) == pytest.approx(500)
+    assert main.calibrated_rps([13], runs) == math.inf
+
+
+#######
+#
+#   COMPARE
+#
+######
+
+
+def test_mann_whitney_test():
+    # all baseline above candidate, most extreme of 20 splits, two sided
+    assert main.mann_whitney_test([10, 11, 12], [1, 2, 3]) == pytest.approx(0.1)
+    assert main.mann_whitney_test([1, 2, 3], [1, 2, 3]) == 1
+    assert main.mann_whitney_min_p_value([0] * 3, [0] * 3) == pytest.approx(0.1)
+    assert main.mann_whitney_min_p_value([0] * 4, [0] * 4) < 0.05
+
+
+def test_compare_task_samples():
+    thresholds = {'rps': 0.05, 'init_time': 0.1, 'gpu_ram': 0.05}
+    baseline = main.TaskSamples(
+        gpu_rams=[0, 0, 0, 0],
+        init_times=[10, 10, 11, 10],
+        rpses=[100, 101, 99, 100]
+    )
+    candidate = main.TaskSamples(
+        gpu_rams=[0, 0, 0, 0],
+        init_times=[10, 11, 10, 10],
+        rpses=[50, 51, 49, 50]
+    )
+    records = dict(main.compare_task_samples(baseline, candidate, thresholds, alpha=0.05))
+
+    # zero baseline median is skipped, no ZeroDivisionError
+    assert set(records) == {'rps', 'init_time'}
+
+    _, _, delta, p_value, regression, testable = records['rps']
+    assert delta == pytest.approx(-0.5)
+    assert p_value < 0.05
+    assert regression and testable
+    assert not records['init_time'][4]
+
+    # 3 vs 3, 50% drop can not be significant
+    baseline.rpses, candidate.rpses = baseline.rpses[:3], candidate.rpses[:3]
+    records = dict(main.compare_task_samples(baseline, candidate, thresholds, alpha=0.05))
+    _, _, _, _, regression, testable = records['rps']
+    assert not regression and not testable
+
+
+#######
+#
+#   NPZ
+#
+######
+
+
+def test_npz_round_trip(tmp_path):
+    records = [
+        main.BenchRecord(
+            timestamp=1626190000.123456, cpu_usage=None, ram=2545942528,
+            gpu_usage=0.43, gpu_ram=None, monotonic=5.5, missed_ticks=0,
+            probes=['proc', 'nvidia']
+        ),
+        main.BenchRecord(
+            timestamp=1626190000.423456, cpu_usage=1.5, ram=2545946624,
+            gpu_usage=None, gpu_ram=4435 * main.MB, monotonic=5.8,
+            read_bytes=4096
+        ),
+    ]
+    events = [main.BenchEvent('start', 1626190000.0, 5.3, None)]
+    array = main.records_array(records)
+    assert list(main.array_records(array))[0].ram == records[0].ram
+
+    path = str(tmp_path / '1_1_01.npz')
+    main.dump_bench_npz(records, events, path)
+    records_, events_ = main.load_bench_npz(path)
+    assert events_ == events
+
+    # None survives as nan, ints stay ints, no probes -> None
+    records[1].probes = None
+    assert records_ == records
+    assert type(records_[0].ram) is int
+
+
+#######
+#
+#   STEADY
+#
+######
+
+
+def test_change_points():
+    values = [1, 1.1, 0.9, 1, 1] * 2 + [5, 5.1, 4.9, 5, 5] * 2
+    penalty = main.change_penalty(values)
+    assert main.change_points(values, penalty) == [10]
+    assert main.steady_window(values) == (10, 20)
+
+
+def test_series_buckets():
+    buckets = main.SeriesBuckets(size=16)
+    for index in range(1000):
+        buckets.add(index, 1)
+    series = buckets.series()
+    assert len(series) <= 16
+    assert all(value == 1 for _, value in series)
+    assert series[0][0] < series[-1][0]
+
+
+def test_steady_stats_streaming():
+    # 2 sec warm-up at 10 rps, 10 sec at 100 rps
+    stamps = (
+        [2 + _ * 0.1 for _ in range(20)]
+        + [4 + _ * 0.01 for _ in range(1000)]
+    )
+    bench = make_bench([
+        ('start', 0, None),
+        ('first_output', 2, None),
+        ('feed_end', 20, None),
+        ('outputs', 14, stamps),
+    ])
+    stats = main.steady_stats(bench)
+    assert stats.warmup_time == pytest.approx(2, abs=0.5)
+    assert stats.rps == pytest.approx(100, rel=0.05)
+
+
+def test_steady_stats_burst():
+    # jiant, idle init, 2 sec ramp, busy, all predictions at 16
+    records = []
+    for index in range(40):
+        time = index * 0.5
+        if time < 5 or time >= 15:
+            gpu_usage = 0
+        elif time < 7:
+            gpu_usage = 0.3
+        else:
+            gpu_usage = 0.9
+        records.append(main.BenchRecord(
+            timestamp=time, cpu_usage=1, ram=0,
+            gpu_usage=gpu_usage, gpu_ram=0, monotonic=time
+        ))
+    bench = make_bench([
+        ('start', 0, None),
+        ('feed_end', 0.1, None),
+        ('first_output', 16, None),
+        ('outputs', 16, [16, 16.01, 16.02]),
+    ], records)
+    assert not main.streams_outputs(bench)
+
+    stats = main.steady_stats(bench)
+    assert stats.rps is None
+    assert stats.warmup_time == pytest.approx(2, abs=0.5)
+    assert stats.steady_time == pytest.approx(7.5, abs=0.5)
+
+
+def test_init_read_time():
+    # reads in 2 of 4 init intervals
+    reads = [0, 100, 100, 300, 300, 300, 400]
+    records = [
+        main.BenchRecord(
+            timestamp=index, cpu_usage=1, ram=0, gpu_usage=0, gpu_ram=0,
+            monotonic=index, read_bytes=value
+        )
+        for index, value in enumerate(reads)
+    ]
+    bench = make_bench([
+        ('start', 0, None),
+        ('init_end', 4.5, None),
+        ('outputs', 6, [4.4, 5, 5.5, 6]),
+    ], records)
+    phase = main.phase_stats(bench)
+    assert phase.init_read_bytes == 300
+    assert phase.init_read_time == 2
+
+    stats = main.bench_stats(bench)
+    assert stats.read_time == 3
@@ -1,5 +1,6 @@
 
 import re
+import sys
 import json
 from collections import (
     Counter,
@@ -9,24 +10,51 @@ from random import (
     seed,
     random,
     choice,
-    sample,
+    sample
 )
-from dataclasses import dataclass
-from math import ceil
+from dataclasses import (
+    dataclass,
+    fields
+)
+from math import ceil, inf
 from os import listdir
 from os.path import (
     join,
-    exists
+    exists,
+    isdir,
+    dirname
+)
+from importlib.util import (
+    spec_from_file_location,
+    module_from_spec
 )
 from math import sqrt
 import statistics
 
+import numpy as np
 import pandas as pd
 
 from matplotlib import patches
 from matplotlib import pyplot as plt
 
 
+def load_bench_main():
+    # bench/main.py has the same module name, load by path. Bench
+    # stats algorithms live there, not copied here. Reuse module
+    # loaded by bench/test_main.py
+    name = 'bench_main'
+    if name not in sys.modules:
+        path = join(dirname(__file__), 'bench', 'main.py')
+        spec = spec_from_file_location(name, path)
+        module = module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+bench_main = load_bench_main()
+
+
 DANETQA = 'danetqa'
 LIDIRUS = 'lidirus'
 MUSERC = 'muserc'
@@ -122,6 +150,8 @@ TEST = 'test'
 VAL = 'val'
 
 JSON = '.json'
+JSONL = '.jsonl'
+NPZ = '.npz'
 
 JIANT_BENCH_DIR = 'bench/data/jiant'
 
@@ -401,12 +431,80 @@ class BenchRecord:
     ram: int
     gpu_usage: float
     gpu_ram: int
+    cpu_load: float = None
+
+    monotonic: float = None
+    missed_ticks: int = None
+
+    tree_size: int = None
+    tree_cpu_usage: float = None
+    tree_ram: int = None
+
+    cgroup_cpu_usage: float = None
+    cgroup_ram: int = None
+    cgroup_peak_ram: int = None
+
+    gpu_power: float = None
+
+    probes: list = None
+
+    peak_ram: int = None
+
+    read_bytes: int = None
+    write_bytes: int = None
+    major_faults: int = None
+
+
+@dataclass
+class BenchEvent:
+    event: str
+    timestamp: float
+    monotonic: float
+    value: object = None
+
+
+def load_bench_array(path):
+    # columnar bench, see bench/main.py convert
+    with np.load(path) as data:
+        return data['records']
+
+
+def array_records(array):
+    size = len(array)
+    columns = []
+    for field in fields(BenchRecord):
+        if field.name in array.dtype.names:
+            values = array[field.name].tolist()
+            parse = int if field.type is int else float
+            values = [
+                None if value != value else parse(value)  # nan
+                for value in values
+            ]
+        else:
+            values = [None] * size
+        columns.append(values)
+
+    for values in zip(*columns):
+        yield BenchRecord(*values)
 
 
 def load_bench(path):
+    if path.endswith(NPZ):
+        array = load_bench_array(path)
+        yield from array_records(array)
+        return
+
     items = load_jsonl(path)
     for item in items:
-        yield BenchRecord(**item)
+        # skip events, {"event": "feed_end", ...}
+        if 'event' not in item:
+            yield BenchRecord(**item)
+
+
+def find_event(events, name):
+    for event in events:
+        if event.event == name:
+            return event
 
 
 #######
@@ -426,11 +524,20 @@ class BenchRegistryRecord:
 
 def list_bench_registry(dir):
     for model in listdir(dir):
+        # skip bench-matrix manifest.jsonl
+        if not isdir(join(dir, model)):
+            continue
         for task in listdir(join(dir, model)):
-            for filename in listdir(join(dir, model, task)):
-                match = re.match(r'(\d+)_(\d+)_(\d+)\.jsonl', filename)
+            # same bench may be in both jsonl and npz
+            keys = set()
+            for filename in sorted(listdir(join(dir, model, task))):
+                match = re.match(r'(\d+)_(\d+)_(\d+)\.(?:jsonl|npz)$', filename)
                 if match:
                     input_size, batch_size, index = map(int, match.groups())
+                    key = input_size, batch_size, index
+                    if key in keys:
+                        continue
+                    keys.add(key)
                     yield BenchRegistryRecord(
                         dir, model, task,
                         input_size, batch_size, index
@@ -456,11 +563,20 @@ def registry_bench_path(dir, model, task, input_size, batch_size, index=1):
     return join(dir, model, task, f'{input_size}_{batch_size}_{index:02d}.jsonl')
 
 
-def load_registry_bench(record):
+def find_registry_bench_path(record):
     path = registry_bench_path(
         record.dir, record.model, record.task,
         record.input_size, record.batch_size, record.index
     )
+    # prefer npz, faster load
+    npz_path = path[:-len(JSONL)] + NPZ
+    if exists(npz_path):
+        return npz_path
+    return path
+
+
+def load_registry_bench(record):
+    path = find_registry_bench_path(record)
     return list(load_bench(path))
 
 
@@ -474,6 +590,8 @@ class BenchStats:
     total_time: int
     gpu_time: int
     max_gpu_ram: int
+    steady_rps: float = None
+    warmup_time: float = None
 
 
 def safe_max(values):
@@ -482,12 +600,19 @@ def safe_max(values):
         return max(values)
 
 
+def record_time(record):
+    # old benches have no monotonic
+    if record.monotonic is not None:
+        return record.monotonic
+    return record.timestamp
+
+
 def bench_stats(records, gpu_usage_treshold=0.1):
     total_time = None
     if records:
         total_time = (
-            records[-1].timestamp
-            - records[0].timestamp
+            record_time(records[-1])
+            - record_time(records[0])
         )
 
     max_gpu_ram = safe_max(
@@ -504,12 +629,32 @@ def bench_stats(records, gpu_usage_treshold=0.1):
                 and record.gpu_usage >= gpu_usage_treshold
                 and previous
         ):
-            gpu_time += (record.timestamp - previous)
-        previous = record.timestamp
+            gpu_time += (record_time(record) - previous)
+        previous = record_time(record)
 
     return BenchStats(total_time, gpu_time, max_gpu_ram)
 
 
+def registry_bench_stats(record):
+    # One read per file, jsonl or npz. Stats and steady state are
+    # from bench/main.py, see bench_main.steady_stats. Jiant logs
+    # have no output stamps, steady_rps is None, warmup_time is from
+    # gpu usage
+    path = find_registry_bench_path(record)
+    bench = bench_main.scan_bench(path)
+    if not bench.accumulator.count:
+        return BenchStats(None, 0, None)
+
+    stats = bench.accumulator.stats()
+    steady = bench_main.steady_stats(bench)
+    return BenchStats(
+        stats.total_time, stats.gpu_time,
+        stats.max_gpu_ram or None,
+        steady_rps=steady.rps if steady else None,
+        warmup_time=steady.warmup_time if steady else None
+    )
+
+
 #######
 #   GROUP
 #######
@@ -525,6 +670,11 @@ class BenchGroup:
     total_times: list[int]
     gpu_times: list[int]
 
+    # input_size runs without warm-up and tail, see
+    # registry_bench_stats
+    steady_rpses: list[float] = None
+    warmup_times: list[float] = None
+
 
 def load_group_benches(
         registry, models=MODELS, tasks=TASKS,
@@ -539,28 +689,28 @@ def load_group_benches(
                 model=model,
                 task=task
             )
-            benches = (load_registry_bench(_) for _ in records)
-            stats = [bench_stats(_) for _ in benches]
+            stats = [registry_bench_stats(_) for _ in records]
 
             gpu_rams = [_.max_gpu_ram for _ in stats if _.max_gpu_ram]
             init_times = [_.total_time for _ in stats if _.total_time]
 
-            records = query_bench_registry(
+            records = list(query_bench_registry(
                 registry,
                 input_size=input_size,
                 batch_size=batch_size,
                 model=model,
                 task=task
-            )
-            benches = (load_registry_bench(_) for _ in records)
-            stats = [bench_stats(_) for _ in benches]
+            ))
+            stats = [registry_bench_stats(_) for _ in records]
 
             total_times = [_.total_time for _ in stats]
             gpu_times = [_.gpu_time for _ in stats]
 
             yield BenchGroup(
                 model, task, input_size,
-                gpu_rams, init_times, total_times, gpu_times
+                gpu_rams, init_times, total_times, gpu_times,
+                steady_rpses=[_.steady_rps for _ in stats if _.steady_rps is not None],
+                warmup_times=[_.warmup_time for _ in stats if _.warmup_time is not None]
             )
 
 
@@ -1095,6 +1245,36 @@ def show_proc_time_bench_report(records):
     return bench_report_table(data)
 
 
+def median_ci(values):
+    return bench_main.median_ci(values)
+
+
+def bench_group_gpu_ram_ci(record):
+    if record.gpu_rams:
+        return median_ci(record.gpu_rams)
+
+
+def bench_group_init_time_ci(record):
+    if record.init_times:
+        return median_ci(record.init_times)
+
+
+def bench_group_rps_ci(record, input_size=2000):
+    if not record.init_times or not record.total_times:
+        return
+
+    def statistic(init_times, total_times):
+        init_time = statistics.median(init_times)
+        proc_time = statistics.median(
+            _ - init_time
+            for _ in total_times
+        )
+        # slow init resample eats all processing time
+        return input_size / proc_time if proc_time > 0 else inf
+
+    return bench_main.bootstrap_ci([record.init_times, record.total_times], statistic)
+
+
 def bench_group_rps(record, input_size=2000):
     if not record.init_times or not record.total_times:
         return
@@ -1122,6 +1302,66 @@ def show_rps_bench_report(records):
     return bench_report_table(data)
 
 
+def rps_ci_bench_report_data(records, input_size=2000):
+    for record in records:
+        rps = bench_group_rps(record, input_size)
+        if rps is None:
+            value = ''
+        else:
+            # None is unbounded, slow init resamples eat all
+            # processing time
+            lower, upper = (
+                '∞' if _ is None else '{:0.0f}'.format(_)
+                for _ in bench_group_rps_ci(record, input_size)
+            )
+            value = '{:0.0f} [{}, {}]'.format(rps, lower, upper)
+        yield record.model, record.task, value
+
+
+def show_rps_ci_bench_report(records):
+    data = rps_ci_bench_report_data(records)
+    return bench_report_table(data)
+
+
+def bench_group_steady_rps(record):
+    if record.steady_rpses:
+        return statistics.median(record.steady_rpses)
+
+
+def steady_rps_bench_report_data(records):
+    # rps folds warm-up and last partial batch in, steady rps does
+    # not, see bench_main.steady_stats. Needs output stamps of
+    # streaming or --warm logs, blank for jiant and old logs
+    for record in records:
+        rps = bench_group_steady_rps(record)
+        if rps is None:
+            value = ''
+        else:
+            value = '{:0.0f}'.format(rps)
+        yield record.model, record.task, value
+
+
+def show_steady_rps_bench_report(records):
+    data = steady_rps_bench_report_data(records)
+    return bench_report_table(data)
+
+
+def warmup_time_bench_report_data(records):
+    # From output rate and gpu usage, gpu usage only for jiant and
+    # old logs, see bench_main.burst_steady_stats
+    for record in records:
+        if record.warmup_times:
+            value = '{:0.1f}'.format(statistics.median(record.warmup_times))
+        else:
+            value = ''
+        yield record.model, record.task, value
+
+
+def show_warmup_time_bench_report(records):
+    data = warmup_time_bench_report_data(records)
+    return bench_report_table(data)
+
+
 def raw_rps_bench_report_data(records, input_size=2000):
     for record in records:
         value = bench_group_rps(record, input_size)